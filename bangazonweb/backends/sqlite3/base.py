@@ -0,0 +1,68 @@
+"""
+Django's SQLite backend, tuned for several request threads or worker processes
+writing at once.
+
+SQLite allows one writer at a time. Out of the box a writer that finds the
+database locked fails straight away with "database is locked", and a
+transaction that reads before it writes (checkout, adding to the cart) can't
+wait its turn at all: by the time it asks for the write lock another writer
+may have changed what it read. This backend applies these OPTIONS, each of
+which can be overridden in settings.DATABASES:
+
+    journal_mode  -- 'WAL' (default): readers no longer block the writer, nor
+                     the writer the readers
+    synchronous   -- 'NORMAL' (default): with WAL, commits no longer wait for
+                     an fsync; a power cut can lose the last commits but can't
+                     corrupt the database
+    busy_timeout  -- 5000 (default): milliseconds a writer waits for the lock
+                     before giving up
+    immediate     -- True (default): transactions start with BEGIN IMMEDIATE,
+                     taking the write lock up front, so they wait for it
+                     (up to busy_timeout) instead of failing part way through
+"""
+from django.db.backends.sqlite3 import base
+
+
+TUNING_OPTIONS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'immediate': True,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    purpose: Connects to SQLite with the concurrency settings above applied
+    args: Extends Django's SQLite DatabaseWrapper
+    returns: (None): N/A
+    """
+
+    def tuning(self):
+        options = dict(TUNING_OPTIONS)
+        options.update((key, value) for key, value in self.settings_dict['OPTIONS'].items() if key in TUNING_OPTIONS)
+        return options
+
+    def get_connection_params(self):
+        # the tuning options are applied below rather than passed on to sqlite3.connect()
+        params = super(DatabaseWrapper, self).get_connection_params()
+        for key in TUNING_OPTIONS:
+            params.pop(key, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        tuning = self.tuning()
+        if tuning['journal_mode'] and not self.is_in_memory_db():
+            conn.execute('PRAGMA journal_mode = {}'.format(tuning['journal_mode']))
+        if tuning['synchronous']:
+            conn.execute('PRAGMA synchronous = {}'.format(tuning['synchronous']))
+        if tuning['busy_timeout'] is not None:
+            conn.execute('PRAGMA busy_timeout = {:d}'.format(int(tuning['busy_timeout'])))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.tuning()['immediate']:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super(DatabaseWrapper, self)._start_transaction_under_autocommit()
@@ -0,0 +1,153 @@
+"""
+Read replicas for the catalog.
+
+Most requests only read the catalog (the product list, search, product
+pages, product types), so with replicas configured (DATABASE_REPLICA_URLS,
+see settings) ReplicaRouter sends reads of the catalog models to them and
+everything else -- carts, orders, users, all writes -- to the primary
+('default'). Replicas are picked round robin, or with
+DATABASE_REPLICA_SELECTION = 'least_latency' the one that answered a
+SELECT 1 fastest when last measured (every REPLICA_LATENCY_INTERVAL
+seconds).
+
+Replicas lag behind the primary, so a shopper who has just written
+something must read it back from the primary. Reads are sent to the
+primary while the primary is inside a transaction, for the rest of any
+request that is a POST or writes, and, through a cookie set by
+PrimaryPinningMiddleware, for REPLICA_PIN_SECONDS after that request.
+
+To try this locally with two SQLite files, copy the database and point a
+replica at the copy:
+
+    cp db.sqlite3 replica.sqlite3
+    DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 python manage.py runserver
+"""
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# the models whose reads can be served from a replica, as app_label.model_name
+CATALOG_MODELS = {'website.product', 'website.producttype', 'website.productphotorendition'}
+
+PIN_COOKIE = 'pin_primary'
+
+_state = threading.local()
+
+
+def pin_to_primary():
+    """
+    purpose: Sends every read for the rest of the current request to the primary, and keeps doing so for the
+        user's requests over the next REPLICA_PIN_SECONDS
+    args: None
+    returns: (None): N/A
+    """
+    _state.pinned = True
+    _state.wrote = True
+
+
+def unpin_from_primary():
+    _state.pinned = _state.wrote = False
+
+
+def pinned_to_primary():
+    return getattr(_state, 'pinned', False)
+
+
+class ReplicaRouter(object):
+    """
+    purpose: Routes catalog reads to the replica databases and everything else to the primary
+    args: replicas: (list): the replica database aliases; by default every alias in settings.DATABASES but the
+        primary, selection: (string): 'round_robin' or 'least_latency'; by default DATABASE_REPLICA_SELECTION
+    returns: (None): N/A
+    """
+
+    def __init__(self, replicas=None, selection=None):
+        if replicas is None:
+            replicas = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+        self.replicas = list(replicas)
+        self.selection = selection or getattr(settings, 'DATABASE_REPLICA_SELECTION', 'round_robin')
+        if self.selection not in ('round_robin', 'least_latency'):
+            raise ValueError('Unknown replica selection {!r}'.format(self.selection))
+        self._cycle = itertools.cycle(self.replicas)
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._measured = None
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or model._meta.label_lower not in CATALOG_MODELS:
+            return None
+        if pinned_to_primary() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if self.selection == 'least_latency':
+            return self._fastest()
+        with self._lock:
+            return next(self._cycle)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS} | set(self.replicas)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        if db in self.replicas:
+            return False
+        return None
+
+    def latency(self, alias):
+        """
+        purpose: Times a round trip to a database
+        args: alias: (string): the database alias
+        returns: (float): the seconds a SELECT 1 took, or infinity when the database can't be reached
+        """
+        started = time.perf_counter()
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        except Exception:
+            return float('inf')
+        return time.perf_counter() - started
+
+    def _fastest(self):
+        interval = getattr(settings, 'REPLICA_LATENCY_INTERVAL', 30)
+        with self._lock:
+            if self._measured is None or time.monotonic() - self._measured > interval:
+                self._latencies = {alias: self.latency(alias) for alias in self.replicas}
+                self._measured = time.monotonic()
+            return min(self.replicas, key=lambda alias: self._latencies[alias])
+
+
+class PrimaryPinningMiddleware(object):
+    """
+    purpose: Pins a user's reads to the primary for the rest of any request that writes and for
+        REPLICA_PIN_SECONDS afterwards, so they read back what they just wrote rather than a lagging replica
+    args: get_response: (callable): the rest of the middleware chain and the view
+    returns: (None): N/A
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.wrote = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        _state.pinned = _state.wrote or PIN_COOKIE in request.COOKIES
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _state.wrote
+            unpin_from_primary()
+
+        if wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5), httponly=True)
+        return response
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 
 import os
 
+from bangazonweb.database import parse_database_url
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -37,16 +39,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'website',
+    'website.apps.WebsiteConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'website.instrumentation.RequestInstrumentationMiddleware',
+    'bangazonweb.routers.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'website.sessions.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +59,8 @@ ROOT_URLCONF = 'bangazonweb.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # the Django backend, with render times measured for RequestInstrumentationMiddleware
+        'BACKEND': 'website.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,13 +81,70 @@ WSGI_APPLICATION = 'bangazonweb.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
 
+# DATABASE_URL picks the database (see bangazonweb.database); SQLite connections get the concurrency tuning
+# in bangazonweb.backends.sqlite3. Connections are kept open for DATABASE_CONN_MAX_AGE seconds and checked
+# before each request unless DATABASE_HEALTH_CHECKS=0.
+
 DATABASES = {
+    'default': parse_database_url(
+        os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite3'),
+        BASE_DIR,
+        conn_max_age=int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        health_checks=os.environ.get('DATABASE_HEALTH_CHECKS', '1') != '0',
+        engine=os.environ.get('DATABASE_ENGINE'),
+    ),
+}
+
+# Catalog reads can be spread over read replicas (see bangazonweb.routers): DATABASE_REPLICA_URLS is a comma
+# separated list of database URLs, picked round robin or, with DATABASE_REPLICA_SELECTION=least_latency, by
+# which answers fastest. A user's reads stay on the primary for REPLICA_PIN_SECONDS after they write.
+
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES['replica{}'.format(number)] = dict(
+        parse_database_url(url.strip(), BASE_DIR, conn_max_age=DATABASES['default']['CONN_MAX_AGE'],
+                           health_checks=DATABASES['default']['CONN_HEALTH_CHECKS']),
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['bangazonweb.routers.ReplicaRouter']
+DATABASE_REPLICA_SELECTION = os.environ.get('DATABASE_REPLICA_SELECTION', 'round_robin')
+REPLICA_LATENCY_INTERVAL = 30
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared cache such as
+# Redis (e.g. django_redis.cache.RedisCache, redis://127.0.0.1:6379/1) when running several processes.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'bangazon'),
     }
 }
 
+# Cache alias and lifetime, in seconds, of the cached catalog pages (index, product types)
+CATALOG_CACHE = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 60 * 60))
+
+# Sessions are read from the cache and written through to the database by default. SESSION_ENGINE can name
+# django.contrib.sessions.backends.cache (cache only; needs a shared, persistent cache) or
+# django.contrib.sessions.backends.signed_cookies (kept in the browser; no server storage at all) instead.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+SESSION_CACHE_ALIAS = 'default'
+
+# Cache alias and lifetime, in seconds, of the signed-in user and their Customer (see website.sessions)
+USER_CACHE = 'default'
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 5 * 60))
+
+# Seconds a product added to a cart stays held for it; run release_expired_holds periodically to give
+# expired holds back to stock
+STOCK_HOLD_SECONDS = int(os.environ.get('STOCK_HOLD_SECONDS', 15 * 60))
+
+# Completed orders older than this many days are moved to the archive tables by archive_orders
+ORDER_ARCHIVE_DAYS = int(os.environ.get('ORDER_ARCHIVE_DAYS', 2 * 365))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -123,3 +185,70 @@ USE_TZ = True
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+
+# File uploads
+# https://docs.djangoproject.com/en/1.11/topics/http/file-uploads/
+# Uploads always stream to a temporary file in chunks; product photos over the size limit or that
+# aren't images are refused while streaming (website.uploads) and re-encoded in the background
+# (website.photos).
+
+FILE_UPLOAD_HANDLERS = [
+    'website.uploads.LimitedImageUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+PRODUCT_PHOTO_MAX_UPLOAD_SIZE = int(os.environ.get('PRODUCT_PHOTO_MAX_UPLOAD_SIZE', 10 * 2 ** 20))
+PRODUCT_PHOTO_MAX_DIMENSION = 1600
+PRODUCT_PHOTO_FORMAT = 'WEBP'  # falls back to progressive JPEG when Pillow was built without WebP
+
+
+# Media serving (website.media): set MEDIA_SENDFILE_HEADER to 'X-Accel-Redirect' (nginx, with an internal
+# location at MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or 'X-Sendfile' (Apache/lighttpd) to have
+# the front server send media files instead of Django.
+
+MEDIA_SENDFILE_HEADER = os.environ.get('MEDIA_SENDFILE_HEADER') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+
+# Background tasks (website.tasks): 'thread' runs them on a local worker pool, 'sync' runs them inline
+
+TASK_BACKEND = os.environ.get('TASK_BACKEND', 'thread')
+TASK_WORKERS = int(os.environ.get('TASK_WORKERS', 2))
+
+
+# Resized copies of each product photo generated after upload: name -> (sorl-thumbnail geometry, crop)
+
+PRODUCT_PHOTO_RENDITIONS = {
+    'detail': ('250x250', 'center'),
+    'listing': ('100x100', 'center'),
+    'cart': ('50x50', 'center'),
+}
+
+
+# Request instrumentation (website.instrumentation): Server-Timing headers, one JSON log line per request on
+# the 'website.instrumentation' logger (INFO), and a WARNING with the repeated SQL for slow requests. It
+# records every query's SQL, as DEBUG does, so it is off by default without DEBUG; to use it in production,
+# turn it on for a sample of requests, e.g. REQUEST_INSTRUMENTATION=1 REQUEST_INSTRUMENTATION_SAMPLE_RATE=0.01.
+
+REQUEST_INSTRUMENTATION = os.environ.get('REQUEST_INSTRUMENTATION', '1' if DEBUG else '0') != '0'
+REQUEST_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('REQUEST_INSTRUMENTATION_SAMPLE_RATE', 1))
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_QUERIES = int(os.environ.get('SLOW_REQUEST_QUERIES', 30))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'website.instrumentation': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
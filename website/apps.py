@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.models.signals import post_migrate
 
 
 class WebsiteConfig(AppConfig):
     name = 'website'
+
+    def ready(self):
+        from website import signals
+        post_migrate.connect(signals.rebuild_search_index, sender=self)
+
+        from bangazonweb.database import close_unusable_connections
+        request_started.connect(close_unusable_connections)
@@ -0,0 +1,87 @@
+"""
+Caching for the catalog pages that are read far more often than the catalog changes.
+
+Cached values are keyed by a catalog version number kept in the cache itself.
+Saving or deleting a Product or ProductType bumps the version (see
+website.signals), so every entry built from the old catalog stops being read
+at once and simply ages out. The cache used is the CATALOG_CACHE alias in
+settings.CACHES, so a shared backend such as Redis works across processes.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+
+VERSION_KEY = 'catalog:version'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOG_CACHE', 'default')]
+
+
+def _increment(key):
+    cache = _cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the key is missing or was evicted; start counting again
+        if cache.add(key, 1, None):
+            return 1
+        return cache.incr(key)
+
+
+def catalog_version():
+    """
+    purpose: Returns the current catalog version
+    args: None
+    returns: (integer): the version number cached catalog values are keyed by
+    """
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """
+    purpose: Invalidates every cached catalog value by moving the catalog on to a new version
+    args: None
+    returns: (integer): the new version
+    """
+    return _increment(VERSION_KEY)
+
+
+def cached_catalog(name, build):
+    """
+    purpose: Reads a catalog value from the cache, building and caching it on a miss
+    args: name: (string): what the value is, e.g. 'index', build: (callable): returns the value
+        from the database; it must be picklable, so evaluate querysets into lists
+    returns: the cached or freshly built value
+    """
+    cache = _cache()
+    key = 'catalog:{}:{}'.format(catalog_version(), name)
+    value = cache.get(key)
+    if value is None:
+        _increment(MISSES_KEY)
+        value = build()
+        cache.set(key, value, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60))
+    else:
+        _increment(HITS_KEY)
+    return value
+
+
+def cache_stats():
+    """
+    purpose: Reports how well the catalog cache is doing
+    args: None
+    returns: (dict): hits, misses and the current catalog version
+    """
+    cache = _cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+        'version': catalog_version(),
+    }
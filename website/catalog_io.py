@@ -0,0 +1,186 @@
+"""
+Streaming reading, validation and writing of catalog rows for the
+import_catalog and export_catalog management commands.
+
+Rows are files of JSON Lines (one JSON object per line) or CSV with a header
+row, read and written one row at a time so memory use doesn't grow with the
+size of the catalog. Each kind of row is described by a CatalogModel below:
+the model it loads into, the columns it has, and how references to other
+rows are written.
+"""
+import csv
+import json
+from decimal import Decimal
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+
+from website.models import Customer, Product, ProductType
+
+
+class CatalogModel(object):
+    """
+    purpose: Describes how one model is written to and read from catalog files
+    args: model: (Model class): the model rows load into, fields: (list): the exported columns, in order,
+        references: (dict): foreign key id column -> (name column, model, natural key field), for rows
+        that name what they point at (e.g. "seller": a username) instead of giving "seller_id"
+    returns: (None): N/A
+    """
+
+    def __init__(self, model, fields, references=None):
+        self.model = model
+        self.fields = fields
+        self.references = references or {}
+
+    def clean(self, row):
+        """
+        purpose: Validates one row and converts its values to Python
+        args: row: (dict): column -> value as read from the file; references must already be ids
+        returns: (dict): field name -> cleaned value, raising ValidationError listing every bad column
+        """
+        cleaned, errors = {}, []
+        for name in self.fields:
+            value = row.get(name)
+            if value == '' or value is None:
+                value = None
+            if name == 'id' and value is None:
+                continue
+            field = self.model._meta.get_field(name[:-3] if name.endswith('_id') else name)
+            if field.is_relation:
+                cleaned[name] = value
+                continue
+            if value is None and not field.null:
+                if field.has_default():
+                    continue
+                if field.blank:
+                    value = ''
+            try:
+                cleaned[name] = field.clean(value, None)
+            except ValidationError as e:
+                errors.append('{}: {}'.format(name, ' '.join(e.messages)))
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+
+    def build(self, cleaned):
+        return self.model(**cleaned)
+
+    def created(self, rows):
+        """
+        purpose: Called inside the import transaction once a batch of rows has been inserted
+        args: rows: (list): the cleaned rows that were inserted
+        returns: (None): N/A
+        """
+        pass
+
+    def values(self):
+        return self.model.objects.order_by('pk').values_list(*self.fields)
+
+
+class UserCatalogModel(CatalogModel):
+    """
+    purpose: Users in catalog files; imported users get a Customer row, as they do when they register
+    args: Extends CatalogModel
+    returns: (None): N/A
+    """
+
+    def clean(self, row):
+        row = dict(row)
+        if not row.get('password'):
+            row['password'] = make_password(None)
+        else:
+            # hashing a plain password costs far more than the rest of the row; only take hashes
+            try:
+                identify_hasher(row['password'])
+            except ValueError:
+                raise ValidationError(['password: must be a password hash, or left empty for an unusable password'])
+        return super(UserCatalogModel, self).clean(row)
+
+    def created(self, rows):
+        # bulk_create doesn't return ids on every database, so look the new users up again
+        user_ids = User.objects.filter(username__in=[row['username'] for row in rows]).values_list('pk', flat=True)
+        Customer.objects.bulk_create([Customer(user_id=user_id) for user_id in user_ids])
+
+
+CATALOG_MODELS = {
+    'users': UserCatalogModel(
+        User,
+        ['id', 'username', 'email', 'first_name', 'last_name', 'password', 'is_active', 'date_joined'],
+    ),
+    'product_types': CatalogModel(ProductType, ['id', 'product_type_name']),
+    'products': CatalogModel(
+        Product,
+        ['id', 'seller_id', 'product_type_id', 'title', 'description', 'price', 'quantity', 'quantity_sold',
+         'city', 'product_photo'],
+        references={
+            'seller_id': ('seller', User, 'username'),
+            'product_type_id': ('product_type', ProductType, 'product_type_name'),
+        },
+    ),
+}
+
+
+def read_rows(file, format):
+    """
+    purpose: Reads a catalog file one row at a time
+    args: file: (text file): the open file, format: (string): 'jsonl' or 'csv'
+    returns: (generator): (line number, dict of column -> value) for each row; a row that can't be
+        parsed is yielded as (line number, ValueError) so the caller can report it and carry on
+    """
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError('expected a JSON object')
+        except ValueError as e:
+            yield line_number, ValueError('invalid JSON: {}'.format(e))
+            continue
+        yield line_number, row
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def write_rows(file, format, fields, rows):
+    """
+    purpose: Writes catalog rows to a file as they are produced
+    args: file: (text file): the open file, format: (string): 'jsonl' or 'csv', fields: (list): column names,
+        rows: (iterable): tuples of values in column order
+    returns: (integer): the number of rows written
+    """
+    count = 0
+    if format == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(['' if value is None else _json_value(value) for value in row])
+        return count
+
+    for count, row in enumerate(rows, 1):
+        file.write(json.dumps(dict(zip(fields, map(_json_value, row))), sort_keys=True) + '\n')
+    return count
+
+
+def format_for(path, format=None):
+    """
+    purpose: Works out a catalog file's format from the --format option or the file's extension
+    args: path: (string): the file path, or '-' for stdin/stdout, format: (string): the --format option, if given
+    returns: (string): 'jsonl' or 'csv'
+    """
+    if format:
+        return format
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
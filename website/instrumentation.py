@@ -0,0 +1,240 @@
+"""
+Per-request performance instrumentation.
+
+RequestInstrumentationMiddleware (first in settings.MIDDLEWARE) measures
+every request: the SQL queries it ran and their total time, the time spent
+rendering templates (timed by InstrumentedDjangoTemplates, the template
+backend in settings.TEMPLATES), the time from the view being called until
+its response came back, and the total. These are sent to the browser as a
+Server-Timing header and logged to the 'website.instrumentation' logger as
+one JSON object per request (at INFO). Requests slower than
+SLOW_REQUEST_MS or running more than SLOW_REQUEST_QUERIES queries are
+logged at WARNING together with the SQL they ran more than once, which is
+what an N+1 query pattern looks like.
+
+Each worker process also keeps per-URL-name histograms of these numbers,
+which staff can read from the request_stats page.
+
+Recording every query's SQL and time costs something on every request, so
+REQUEST_INSTRUMENTATION is off unless DEBUG is on, and
+REQUEST_INSTRUMENTATION_SAMPLE_RATE measures only that fraction of
+requests, e.g. 0.01 in production.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+
+logger = logging.getLogger(__name__)
+
+# upper bounds, in milliseconds, of the request time histogram buckets
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_current = threading.local()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _sampled():
+    # whether to measure this request
+    if not getattr(settings, 'REQUEST_INSTRUMENTATION', settings.DEBUG):
+        return False
+    rate = getattr(settings, 'REQUEST_INSTRUMENTATION_SAMPLE_RATE', 1.0)
+    return rate >= 1 or random.random() < rate
+
+
+class InstrumentedTemplate(Template):
+    """
+    purpose: A Django template that adds its render time to the request being measured
+    args: Extends the Django template backend's Template
+    returns: (None): N/A
+    """
+
+    def render(self, context=None, request=None):
+        timings = getattr(_current, 'timings', None)
+        if timings is None:
+            return super(InstrumentedTemplate, self).render(context, request)
+
+        started = time.perf_counter()
+        try:
+            return super(InstrumentedTemplate, self).render(context, request)
+        finally:
+            timings['template'] += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    purpose: The Django template backend, with render times measured for RequestInstrumentationMiddleware
+    args: Extends the DjangoTemplates backend
+    returns: (None): N/A
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super(InstrumentedDjangoTemplates, self).from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super(InstrumentedDjangoTemplates, self).get_template(template_name).template, self)
+
+
+def query_shape(sql):
+    """
+    purpose: Blanks out the values in a logged SQL statement, so runs of the same statement can be compared
+    args: sql: (string): the statement as recorded in connection.queries
+    returns: (string): the statement with its quoted strings and numbers replaced by ?
+    """
+    return re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", '?', sql)
+
+
+def duplicate_queries(queries, minimum=2):
+    """
+    purpose: Finds the statements a request ran over and over with only the values changing
+    args: queries: (list): the request's queries as recorded in connection.queries, minimum: (integer): how
+        many times a statement must run to be reported
+    returns: (list): (count, SQL with its values replaced by ?) pairs, most repeated first
+    """
+    shapes = Counter(query_shape(query['sql']) for query in queries)
+    return [(count, sql) for sql, count in shapes.most_common() if count >= minimum]
+
+
+def _record(url_name, measurement):
+    total_ms = measurement['total_ms']
+    bucket = next((i for i, bound in enumerate(BUCKETS_MS) if total_ms <= bound), len(BUCKETS_MS))
+    with _stats_lock:
+        stats = _stats.setdefault(url_name, {
+            'requests': 0, 'slow': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0, 'template_ms': 0.0,
+            'total_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(BUCKETS_MS) + 1),
+        })
+        stats['requests'] += 1
+        stats['slow'] += measurement['slow']
+        stats['queries'] += measurement['queries']
+        stats['max_queries'] = max(stats['max_queries'], measurement['queries'])
+        stats['db_ms'] += measurement['db_ms']
+        stats['template_ms'] += measurement['template_ms']
+        stats['total_ms'] += total_ms
+        stats['max_ms'] = max(stats['max_ms'], total_ms)
+        stats['buckets'][bucket] += 1
+
+
+def request_stats():
+    """
+    purpose: Reports the request measurements this worker process has gathered, by URL name
+    args: None
+    returns: (dict): for each URL name, request and slow request counts, mean and max queries, mean database,
+        template and total milliseconds, max milliseconds, and a histogram of total milliseconds
+    """
+    labels = ['<={}ms'.format(bound) for bound in BUCKETS_MS] + ['>{}ms'.format(BUCKETS_MS[-1])]
+    with _stats_lock:
+        snapshot = {url_name: dict(stats, buckets=list(stats['buckets'])) for url_name, stats in _stats.items()}
+
+    report = {}
+    for url_name, stats in sorted(snapshot.items()):
+        requests = stats['requests']
+        report[url_name] = {
+            'requests': requests,
+            'slow': stats['slow'],
+            'mean_queries': round(stats['queries'] / requests, 1),
+            'max_queries': stats['max_queries'],
+            'mean_db_ms': round(stats['db_ms'] / requests, 2),
+            'mean_template_ms': round(stats['template_ms'] / requests, 2),
+            'mean_ms': round(stats['total_ms'] / requests, 2),
+            'max_ms': round(stats['max_ms'], 2),
+            'histogram': dict(zip(labels, stats['buckets'])),
+        }
+    return report
+
+
+def reset_request_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class RequestInstrumentationMiddleware(object):
+    """
+    purpose: Measures queries, database time, template time and view time for every sampled request
+    args: get_response: (callable): the rest of the middleware chain and the view
+    returns: (None): N/A
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _sampled():
+            return self.get_response(request)
+
+        # the debug cursor records each query's SQL and time in connection.queries_log, as with DEBUG on
+        databases = list(connections.all())
+        previous = [(connection, connection.force_debug_cursor, len(connection.queries_log))
+                    for connection in databases]
+        for connection in databases:
+            connection.force_debug_cursor = True
+        _current.timings = {'template': 0.0, 'view_started': None}
+        started = time.perf_counter()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            finished = time.perf_counter()
+            timings, _current.timings = _current.timings, None
+            queries = []
+            for connection, force_debug_cursor, start in previous:
+                connection.force_debug_cursor = force_debug_cursor
+                # Django empties the log when each request starts; it holds the last 9000 queries
+                queries.extend(list(connection.queries_log)[start:])
+
+        view_started = timings['view_started']
+        measurement = {
+            'queries': len(queries),
+            'db_ms': sum(float(query['time']) for query in queries) * 1000,
+            'template_ms': timings['template'] * 1000,
+            'view_ms': (finished - view_started) * 1000 if view_started else 0.0,
+            'total_ms': (finished - started) * 1000,
+        }
+        measurement['slow'] = (
+            measurement['total_ms'] > getattr(settings, 'SLOW_REQUEST_MS', 500)
+            or measurement['queries'] > getattr(settings, 'SLOW_REQUEST_QUERIES', 30)
+        )
+
+        response['Server-Timing'] = ', '.join([
+            'db;dur={:.1f};desc="{} queries"'.format(measurement['db_ms'], measurement['queries']),
+            'tpl;dur={:.1f};desc="templates"'.format(measurement['template_ms']),
+            'view;dur={:.1f};desc="view"'.format(measurement['view_ms']),
+            'total;dur={:.1f};desc="total"'.format(measurement['total_ms']),
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match and match.url_name else 'unresolved'
+        _record(url_name, measurement)
+        self._log(request, response, url_name, measurement, queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(_current, 'timings', None)
+        if timings is not None:
+            timings['view_started'] = time.perf_counter()
+
+    def _log(self, request, response, url_name, measurement, queries):
+        level = logging.WARNING if measurement['slow'] else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+
+        line = {
+            'method': request.method,
+            'path': request.path,
+            'url_name': url_name,
+            'status': response.status_code,
+        }
+        line.update((key, round(value, 2) if isinstance(value, float) else value) for key, value in measurement.items())
+        if measurement['slow']:
+            line['duplicate_queries'] = [
+                {'count': count, 'sql': sql} for count, sql in duplicate_queries(queries)[:10]
+            ]
+        logger.log(level, json.dumps(line))
@@ -0,0 +1,14 @@
+"""
+Helpers shared by the benchmark and load test commands.
+"""
+
+
+def percentile(timings, fraction):
+    """
+    purpose: Picks a percentile from a list of timings, by nearest rank
+    args: timings: (list): the measured times, in any order, fraction: (number): the percentile as a fraction,
+        e.g. 0.99
+    returns: (number): the timing at that percentile
+    """
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(round(fraction * (len(timings) - 1))))]
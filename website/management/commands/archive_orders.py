@@ -0,0 +1,56 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from website.models import ArchivedOrder, ArchivedOrderLine, Order, ProductOrder
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves completed orders older than --days (ORDER_ARCHIVE_DAYS by default) and their lines into the '
+        'ArchivedOrder and ArchivedOrderLine tables, --batch-size orders per transaction, keeping the order '
+        'tables small. Archived orders keep their ids and still show on the profile and order detail pages. '
+        'Orders whose prices were never recorded are left alone; run backfill_order_snapshots first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ORDER_ARCHIVE_DAYS', 2 * 365),
+                            help='archive the orders checked out more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500, help='orders archived per transaction')
+
+    def handle(self, *args, **options):
+        old = Order.objects.filter(active=False, order_date__lt=timezone.now() - datetime.timedelta(
+            days=options['days']))
+
+        archived = lines = 0
+        while True:
+            with transaction.atomic():
+                batch = list(old.filter(total__isnull=False).select_for_update().order_by('pk').values_list(
+                    'pk', 'customer', 'order_date', 'total')[:options['batch_size']])
+                if not batch:
+                    break
+                order_ids = [order[0] for order in batch]
+                ArchivedOrder.objects.bulk_create([
+                    ArchivedOrder(id=order_id, customer_id=customer_id, order_date=order_date, total=total)
+                    for order_id, customer_id, order_date, total in batch
+                ])
+                batch_lines = [
+                    ArchivedOrderLine(order_id=order_id, product_id=product_id, title=title, unit_price=unit_price,
+                                      quantity=quantity)
+                    for order_id, product_id, title, unit_price, quantity in ProductOrder.objects.filter(
+                        order__in=order_ids).values_list('order', 'product', 'title', 'unit_price', 'quantity')
+                ]
+                ArchivedOrderLine.objects.bulk_create(batch_lines)
+                ProductOrder.objects.filter(order__in=order_ids).delete()
+                Order.objects.filter(pk__in=order_ids).delete()
+            archived += len(batch)
+            lines += len(batch_lines)
+
+        self.stdout.write('Archived {} orders with {} lines'.format(archived, lines))
+        skipped = old.filter(total__isnull=True).count()
+        if skipped:
+            self.stderr.write('Left {} orders without recorded prices; run backfill_order_snapshots, then this '
+                              'command again'.format(skipped))
@@ -0,0 +1,116 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from website.models import Customer, Order, PaymentType, Product, ProductOpinion, ProductOrder, ProductType
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs EXPLAIN on the lookups the storefront views make on every request against a seeded, '
+        'rolled-back copy of the data, and fails if any of them reads a whole table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='products to seed before explaining')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError('Query plans can only be audited on SQLite or PostgreSQL')
+
+        with transaction.atomic():
+            hot_queries = self._seed(options['products'])
+            failures = []
+            for name, queryset in hot_queries:
+                plan = self._explain(queryset)
+                full_scans = self._full_scans(plan)
+                self.stdout.write('{}: {}'.format(name, 'FULL SCAN' if full_scans else 'ok'))
+                for line in plan:
+                    self.stdout.write('    ' + line)
+                if full_scans:
+                    failures.append('{} scans {}'.format(name, ', '.join(full_scans)))
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError('Hot queries fall back to full table scans:\n' + '\n'.join(failures))
+
+    def _seed(self, product_count):
+        # spread rows over many sellers, buyers and types so the planner sees realistic selectivity
+        User.objects.bulk_create([User(username='audit_query_plans_{}'.format(i)) for i in range(200)])
+        users = list(User.objects.filter(username__startswith='audit_query_plans_'))
+        sellers, buyers = users[:20], users[20:]
+        Customer.objects.bulk_create([Customer(user=buyer) for buyer in buyers])
+
+        ProductType.objects.bulk_create([ProductType(product_type_name='Type {}'.format(i)) for i in range(50)])
+        product_types = list(ProductType.objects.all())
+        Product.objects.bulk_create([
+            Product(
+                seller=sellers[i % len(sellers)], product_type=product_types[i % len(product_types)],
+                title='Product {}'.format(i), price='1.00', quantity=10,
+            )
+            for i in range(product_count)
+        ])
+        products = list(Product.objects.filter(seller__in=sellers).order_by('pk'))
+
+        PaymentType.objects.bulk_create([
+            PaymentType(payment_type_name=name, account_number=1234, customer=buyer)
+            for buyer in buyers for name in ('Visa', 'AMEX')
+        ])
+        Order.objects.bulk_create([
+            Order(customer=buyer, active=active) for buyer in buyers for active in (False, False, True)
+        ])
+        orders = list(Order.objects.filter(customer__in=buyers))
+        ProductOrder.objects.bulk_create([
+            ProductOrder(order=order, product=products[(order.pk * 7 + i) % len(products)])
+            for order in orders for i in range(3)
+        ])
+
+        buyer, seller, product = buyers[0], sellers[0], products[-1]
+        order = Order.objects.filter(customer=buyer, active=True).first()
+        payment_type = PaymentType.objects.filter(customer=buyer).first()
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        # the lookups the views in website/views.py make, written the way the views write them
+        # (.get() drops the default ordering, hence the bare order_by() on single-row lookups)
+        return [
+            ('add_product_to_order / view_cart: active order', Order.objects.filter(customer=buyer, active=1).order_by()),
+            ('view_cart: order lines', ProductOrder.objects.line_items(order)),
+            ('order_detail: past order lines', ProductOrder.objects.history(order)),
+            ('profile: order history', Order.objects.filter(customer=buyer, active=0, order_date__isnull=False)
+             .order_by('-order_date', '-pk')[:21]),
+            ('add_product_to_order: order line', ProductOrder.objects.filter(order=order, product=product)),
+            ('delete_user_product: product sold', ProductOrder.objects.filter(product=product)),
+            ('user_products: seller page', Product.objects.filter(seller=seller).filter(pk__lt=product.pk).order_by('-pk')[:21]),
+            ('get_product_types: type page', Product.objects.filter(product_type=product.product_type_id).order_by('-pk')[:21]),
+            ('list_products: next page', Product.objects.filter(pk__lt=product.pk).order_by('-pk')[:21]),
+            ('user_payment_types / checkout: payment types', PaymentType.objects.filter(customer=buyer)),
+            ('single_product: opinion', ProductOpinion.objects.filter(product=product.pk, customer=buyer.pk)),
+            ('top_rated', Product.objects.filter(likes__gt=0).order_by('-likes', '-id')[:20]),
+            ('order_confirmation: checkout order', Order.objects.filter(pk=order.pk, customer=buyer, active=1).order_by()),
+            ('order_confirmation: payment type', PaymentType.objects.filter(pk=payment_type.pk, customer=buyer).order_by()),
+        ]
+
+    def _explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(explain + sql, params)
+            # SQLite rows end with the plan detail; PostgreSQL returns one column of plan text
+            return [row[-1] for row in cursor.fetchall()]
+
+    def _full_scans(self, plan):
+        scans = []
+        for line in plan:
+            # SQLite: "SCAN website_product" (a "SCAN ... USING INDEX" walks an index instead)
+            sqlite_scan = re.match(r'\s*SCAN (?:TABLE )?(\w+)(?: AS \w+)?\s*$', line)
+            # PostgreSQL: "Seq Scan on website_product"
+            postgres_scan = re.search(r'Seq Scan on (\w+)', line)
+            scan = sqlite_scan or postgres_scan
+            if scan:
+                scans.append(scan.group(1))
+        return scans
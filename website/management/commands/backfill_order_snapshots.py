@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import CharField, DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from website.models import Order, Product, ProductOrder
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills in the unit price and title of the lines, and the total, of completed orders checked out before '
+        'checkout recorded them (or created in bulk, as generate_data does). The lines get their product\'s '
+        'current price and title, the closest to the originals still known. Safe to stop and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='orders filled in per transaction')
+
+    def handle(self, *args, **options):
+        price = Product.objects.filter(pk=OuterRef('product')).values('price')
+        title = Product.objects.filter(pk=OuterRef('product')).values('title')
+        total = (ProductOrder.objects.filter(order=OuterRef('pk')).order_by().values('order')
+                 .annotate(total=Sum(F('unit_price') * F('quantity'), output_field=DecimalField()))
+                 .values('total'))
+
+        orders = last_id = 0
+        while True:
+            batch = list(Order.objects.filter(pk__gt=last_id, active=False, total__isnull=True)
+                         .order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic():
+                ProductOrder.objects.filter(order__in=batch, unit_price__isnull=True).update(
+                    unit_price=Subquery(price, output_field=DecimalField()),
+                    title=Subquery(title, output_field=CharField()))
+                Order.objects.filter(pk__in=batch).update(
+                    total=Coalesce(Subquery(total, output_field=DecimalField()), 0))
+            orders += len(batch)
+            last_id = batch[-1]
+
+        self.stdout.write('Filled in the prices and totals of {} orders'.format(orders))
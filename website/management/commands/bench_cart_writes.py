@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from website.management.benchutils import percentile
+from website.models import Order, OutOfStock, PaymentType, Product, ProductOrder, ProductType
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures simultaneous cart writes: each thread adds products to its own cart and checks out every '
+        '--checkout-every adds, all against the same few products. Runs against the configured database, or '
+        'with --compare against stock SQLite, tuned SQLite and PostgreSQL (from --postgres-url, or a throwaway '
+        'local server when initdb and psycopg2 are available), each in a fresh database. With --shards, the '
+        'products\' stock is split over that many counter rows, and --compare runs each database with and '
+        'without sharding; --products 1 --checkout-every 1 makes every operation a checkout of one bestseller.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=100, help='cart adds per thread')
+        parser.add_argument('--checkout-every', type=int, default=5)
+        parser.add_argument('--products', type=int, default=5, help='products every thread buys from')
+        parser.add_argument('--shards', type=int, default=0, help='stock counter rows per product (see shard_stock)')
+        parser.add_argument('--compare', action='store_true', help='benchmark each database configuration')
+        parser.add_argument('--postgres-url', default=os.environ.get('BENCH_POSTGRES_URL'),
+                            help='PostgreSQL database URL to include in --compare')
+        parser.add_argument('--json', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self._compare(options)
+
+        result = self._bench(options)
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+        else:
+            self._table([(connection.settings_dict['ENGINE'], result)])
+
+    # --- one configuration, in this process
+
+    def _bench(self, options):
+        shoppers, payment_types, product_ids = self._seed(options)
+        timings, errors = [], []
+        lock = threading.Lock()
+
+        def shop(shopper, payment_type):
+            try:
+                for i in range(options['operations']):
+                    started = time.perf_counter()
+                    try:
+                        order, _ = Order.objects.get_or_create(customer=shopper, active=True)
+                        ProductOrder.objects.add_product(order, Product(pk=product_ids[i % len(product_ids)]))
+                        if (i + 1) % options['checkout_every'] == 0:
+                            order.complete(payment_type)
+                    except OutOfStock:
+                        pass
+                    except Exception as e:
+                        with lock:
+                            errors.append(type(e).__name__ + ': ' + str(e))
+                        continue
+                    with lock:
+                        timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=shop, args=pair) for pair in zip(shoppers, payment_types)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self._clean_up(shoppers)
+        return {
+            'operations': len(timings),
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+            'ops_per_sec': len(timings) / elapsed,
+            'p50_ms': percentile(timings, 0.5) if timings else None,
+            'p99_ms': percentile(timings, 0.99) if timings else None,
+        }
+
+    def _seed(self, options):
+        User.objects.bulk_create([
+            User(username='bench_cart_writes_{}'.format(i)) for i in range(options['threads'] + 1)
+        ])
+        users = list(User.objects.filter(username__startswith='bench_cart_writes_').order_by('pk'))
+        seller, shoppers = users[0], users[1:]
+        product_type = ProductType.objects.create(product_type_name='bench_cart_writes')
+        Product.objects.bulk_create([
+            Product(seller=seller, product_type=product_type, title='Bench {}'.format(i), price='1.00',
+                    quantity=10 ** 9)
+            for i in range(options['products'])
+        ])
+        PaymentType.objects.bulk_create([
+            PaymentType(payment_type_name='Visa', account_number=1234, customer=shopper) for shopper in shoppers
+        ])
+        product_ids = list(Product.objects.filter(seller=seller).values_list('pk', flat=True))
+        if options['shards']:
+            for product in Product.objects.filter(pk__in=product_ids):
+                product.shard_stock(options['shards'])
+        payment_types = [PaymentType.objects.get(customer=shopper) for shopper in shoppers]
+        return shoppers, payment_types, product_ids
+
+    def _clean_up(self, shoppers):
+        users = User.objects.filter(username__startswith='bench_cart_writes_')
+        Order.objects.filter(customer__in=users).delete()
+        PaymentType.objects.filter(customer__in=users).delete()
+        Product.objects.filter(seller__in=users).delete()
+        ProductType.objects.filter(product_type_name='bench_cart_writes').delete()
+        users.delete()
+
+    # --- every configuration, each in a fresh database and its own process
+
+    def _compare(self, options):
+        directory = tempfile.mkdtemp()
+        try:
+            configurations = [
+                ('SQLite, stock Django backend',
+                 {'DATABASE_URL': 'sqlite:///{}/stock.sqlite3'.format(directory),
+                  'DATABASE_ENGINE': 'django.db.backends.sqlite3'}),
+                ('SQLite, WAL + busy_timeout + BEGIN IMMEDIATE',
+                 {'DATABASE_URL': 'sqlite:///{}/tuned.sqlite3'.format(directory)}),
+            ]
+            results = []
+            with self._postgres(options, directory) as postgres_url:
+                if postgres_url:
+                    configurations.append(('PostgreSQL', {'DATABASE_URL': postgres_url}))
+                else:
+                    self.stderr.write('PostgreSQL skipped: pass --postgres-url, or install initdb and psycopg2')
+                for name, environment in configurations:
+                    for shards in sorted({0, options['shards']}):
+                        label = '{}, {} shards'.format(name, shards) if shards else name
+                        results.append((label, self._run(dict(options, shards=shards), environment)))
+        finally:
+            shutil.rmtree(directory)
+        self._table(results)
+
+    def _run(self, options, environment):
+        env = dict(os.environ, **environment)
+        manage = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+        subprocess.check_call(manage + ['migrate', '--run-syncdb', '-v', '0'], env=env)
+        output = subprocess.check_output(manage + [
+            'bench_cart_writes', '--json', '--threads', str(options['threads']),
+            '--operations', str(options['operations']), '--checkout-every', str(options['checkout_every']),
+            '--products', str(options['products']), '--shards', str(options['shards']),
+        ], env=env)
+        return json.loads(output.decode().strip().splitlines()[-1])
+
+    @contextlib.contextmanager
+    def _postgres(self, options, directory):
+        if options['postgres_url']:
+            yield options['postgres_url']
+            return
+        try:
+            import psycopg2  # noqa: F401
+        except ImportError:
+            yield None
+            return
+        if not (shutil.which('initdb') and shutil.which('pg_ctl')):
+            yield None
+            return
+
+        # a throwaway server in the temporary directory, listening on a free port
+        data = os.path.join(directory, 'postgres')
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        subprocess.check_call(['initdb', '-D', data, '-U', 'bench', '-A', 'trust'], stdout=subprocess.DEVNULL)
+        subprocess.check_call(['pg_ctl', '-D', data, '-w', '-o', '-p {} -k {}'.format(port, directory),
+                               '-l', os.path.join(directory, 'postgres.log'), 'start'], stdout=subprocess.DEVNULL)
+        try:
+            subprocess.check_call(['createdb', '-h', '127.0.0.1', '-p', str(port), '-U', 'bench', 'bench'])
+            yield 'postgres://bench@127.0.0.1:{}/bench'.format(port)
+        finally:
+            subprocess.call(['pg_ctl', '-D', data, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+
+    def _table(self, results):
+        self.stdout.write('{:<58} {:>9} {:>7} {:>9} {:>8} {:>8}'.format(
+            'database', 'cart ops', 'errors', 'ops/sec', 'p50 ms', 'p99 ms'))
+        for name, result in results:
+            self.stdout.write('{:<58} {:>9} {:>7} {:>9.1f} {:>8} {:>8}'.format(
+                name, result['operations'], result['errors'], result['ops_per_sec'],
+                '-' if result['p50_ms'] is None else '{:.1f}'.format(result['p50_ms']),
+                '-' if result['p99_ms'] is None else '{:.1f}'.format(result['p99_ms'])))
+        for name, result in results:
+            if result['first_error']:
+                self.stdout.write('{}: first error: {}'.format(name, result['first_error']))
@@ -0,0 +1,147 @@
+import io
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import engines
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from PIL import Image
+
+from website.management.benchutils import percentile
+from website.models import Product, ProductType
+from website.photos import generate_renditions
+
+
+# single.html as it was before renditions: sorl resizes (or looks up) the photo while rendering
+LEGACY_PHOTO_TEMPLATE = """{% extends 'main.html' %}
+
+{% block content %}
+
+{% load thumbnail %}
+{% load staticfiles %}
+
+    <hr>
+    <h3>Product Detail</h3>
+
+    <ul>
+    {% if product.product_photo %}
+      <li>
+        {% thumbnail product.product_photo "250x250" crop="center" as im %}
+          <a href="{{ product.product_photo.url }}" target="_new">
+          <img src="{{ im.url }}" width="{{ im.width }}" height="{{ im.height }}">
+          </a>
+        {% endthumbnail %}
+      </li>
+    {% endif %}
+
+      <li>Title: {{ product.title }}</li>
+      <li>Description: {{ product.description }}</li>
+      {% if product.quantity > 0 %}
+        <li>Quantity Available: {{ product.quantity }}</li>
+      {% else %}
+        <li>Quantity Available: Out of Stock</li>
+      {% endif %}
+      <li>Price/Unit: {{ product.price }}</li>      
+      {% if product.city %}      
+      <li>Available in: {{ product.city }}</li>  
+      {% endif %}
+    </ul>
+    
+  {% if user.is_authenticated %}
+      <form action="{% url 'website:single_product' product.id %}" method="POST">
+        {% csrf_token %}
+        <input type="hidden" name="opinion" value="1">
+        <input class="btn btn-success btn-sm" type="submit" value="Like">
+      </form>
+
+      <form action="{% url 'website:single_product' product.id %}" method="POST">
+        {% csrf_token %}
+        <input type="hidden" name="opinion" value="-1">
+        <input class="btn btn-danger btn-sm" type="submit" value="Dislike">
+      </form>
+
+      {% if product.quantity > 0 %}
+      <form action="/add_to_cart/{{ product.id }}/" method="POST">
+      <hr>
+      {% csrf_token %}
+          <button class="btn btn-success btn-lg">Add to Cart</button>
+      </form>
+      {% endif %}
+  {% endif %}
+
+
+
+{% endblock %}"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures p50/p99 render latency of the single_product page with the photo resized while rendering '
+        '(the old sorl {% thumbnail %} tag) against pre-generated renditions. Uses a throwaway media '
+        'directory and rolls back the products it creates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50)
+        parser.add_argument('--photo-size', type=int, default=1600, help='width of the generated photos, in pixels')
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root), transaction.atomic():
+                product_ids = self._seed(options['products'], options['photo_size'])
+                request = RequestFactory().get('/')
+                request.user = AnonymousUser()
+                # compile both pages once, so only rendering is timed
+                legacy = engines['django'].from_string(LEGACY_PHOTO_TEMPLATE)
+                current = engines['django'].get_template('single.html')
+
+                def render_legacy(product_id):
+                    legacy.render({'product': Product.objects.get(pk=product_id)}, request)
+
+                def render_current(product_id):
+                    product = Product.objects.prefetch_related('renditions').get(pk=product_id)
+                    current.render({'product': product}, request)
+
+                results = [
+                    ('sorl tag, first view', self._time(product_ids, render_legacy)),
+                    ('sorl tag, repeat view', self._time(product_ids, render_legacy)),
+                ]
+                for product_id in product_ids:
+                    generate_renditions(product_id)
+                results.append(('pre-generated renditions', self._time(product_ids, render_current)))
+
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root)
+
+        self.stdout.write('{:<26} {:>10} {:>10}'.format('single_product render', 'p50 ms', 'p99 ms'))
+        for name, timings in results:
+            self.stdout.write('{:<26} {:>10.2f} {:>10.2f}'.format(
+                name, percentile(timings, 0.5), percentile(timings, 0.99)))
+
+    def _seed(self, count, photo_size):
+        seller = User.objects.create_user(username='bench_product_page_seller')
+        product_type = ProductType.objects.create(product_type_name='Benchmark')
+        product_ids = []
+        for i in range(count):
+            photo = io.BytesIO()
+            Image.new('RGB', (photo_size, photo_size * 3 // 4), (i % 256, 120, 40)).save(photo, 'JPEG', quality=90)
+            product = Product(seller=seller, product_type=product_type, title='Photo {}'.format(i), price='1.00', quantity=1)
+            product.product_photo.save('bench_{}.jpg'.format(i), ContentFile(photo.getvalue()), save=False)
+            product.save()
+            product_ids.append(product.pk)
+        return product_ids
+
+    def _time(self, product_ids, render):
+        timings = []
+        for product_id in product_ids:
+            started = time.perf_counter()
+            render(product_id)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
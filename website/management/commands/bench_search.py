@@ -0,0 +1,85 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from website.models import Product, ProductType
+from website.search import get_backend, search_products
+
+
+WORDS = (
+    'llama', 'magic', 'wand', 'hat', 'beard', 'comb', 'oil', 'emoji', 'sticker', 'keys', 'vintage', 'leather',
+    'wooden', 'ceramic', 'mug', 'lamp', 'chair', 'table', 'guitar', 'string', 'poster', 'print', 'candle', 'soap',
+)
+CITIES = ('Nashville', 'Memphis', 'Knoxville', 'Chattanooga', 'Franklin', 'Murfreesboro', 'Clarksville', 'Jackson')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares search latency of the old LIKE scan against the configured search backend at several catalog '
+        'sizes. The generated products are rolled back when the benchmark finishes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=20, help='searches to time at each size')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        backend = get_backend()
+        self.stdout.write('backend: {}'.format(type(backend).__name__))
+        self.stdout.write('{:>10} {:>14} {:>14} {:>10}'.format('products', 'like ms/query', 'index ms/query', 'speedup'))
+
+        for size in options['sizes']:
+            with transaction.atomic():
+                self._seed(size, rng)
+                backend.rebuild()
+
+                terms = [rng.choice(WORDS + CITIES) for i in range(options['queries'])]
+                like_ms = self._time(terms, self._like_search)
+                index_ms = self._time(terms, self._index_search)
+
+                transaction.set_rollback(True)
+
+            self.stdout.write('{:>10} {:>14.2f} {:>14.2f} {:>9.1f}x'.format(
+                size, like_ms, index_ms, like_ms / index_ms if index_ms else float('inf')))
+
+        # put the index back in step with the rolled back product table
+        backend.rebuild()
+
+    def _seed(self, size, rng):
+        seller = User.objects.create_user(username='bench_search_seller')
+        product_type = ProductType.objects.create(product_type_name='Benchmark')
+        batch = []
+        for i in range(size):
+            batch.append(Product(
+                seller=seller,
+                product_type=product_type,
+                title=' '.join(rng.choice(WORDS) for w in range(3)),
+                description=' '.join(rng.choice(WORDS) for w in range(12)),
+                price='9.99',
+                quantity=1,
+                city=rng.choice(CITIES),
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+    def _like_search(self, term):
+        # the search view before the index: an unbounded LIKE scan, every match rendered
+        return list(Product.objects.order_by('title').filter(Q(title__contains=term) | Q(city__contains=term)).distinct())
+
+    def _index_search(self, term):
+        results = search_products(term)
+        return results.count(), results[0:20]
+
+    def _time(self, terms, search):
+        started = time.perf_counter()
+        for term in terms:
+            search(term)
+        return (time.perf_counter() - started) * 1000 / len(terms)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from website.models import Product, StockShard
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes the totals of every sharded product\'s stock shards into its quantity, quantity_sold and reserved '
+        'columns, which are otherwise only as fresh as the last run. With --rebalance, also shares each '
+        'product\'s free units out evenly over its shards again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebalance', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['rebalance']:
+            for product_id in Product.objects.filter(stock_shards__gt=0).values_list('pk', flat=True):
+                StockShard.objects.rebalance(product_id)
+        with transaction.atomic():
+            consolidated = StockShard.objects.consolidate()
+        self.stdout.write('Consolidated the stock of {} sharded products'.format(consolidated))
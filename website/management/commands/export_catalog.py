@@ -0,0 +1,40 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website.catalog_io import CATALOG_MODELS, format_for, write_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes users, product types or products to a JSON Lines or CSV file that import_catalog can load, '
+        'streaming rows from the database so memory use stays flat however large the catalog is.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(CATALOG_MODELS), help='what to export')
+        parser.add_argument('path', nargs='?', default='-', help="the file to write, or '-' for standard output")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='defaults to csv for .csv files, else jsonl')
+
+    def handle(self, *args, **options):
+        catalog_model = CATALOG_MODELS[options['kind']]
+        path = options['path']
+
+        try:
+            file = self.stdout if path == '-' else io.open(path, 'w', encoding='utf-8', newline='')
+        except IOError as e:
+            raise CommandError('Cannot write {}: {}'.format(path, e))
+
+        started = time.time()
+        try:
+            # iterator() reads the rows in chunks rather than caching the whole queryset
+            exported = write_rows(
+                file, format_for(path, options['format']), catalog_model.fields, catalog_model.values().iterator())
+        finally:
+            if file is not self.stdout:
+                file.close()
+
+        elapsed = max(time.time() - started, 1e-6)
+        self.stderr.write('{}: {} exported in {:.1f}s ({:.0f} rows/sec)'.format(
+            catalog_model.model._meta.verbose_name_plural, exported, elapsed, exported / elapsed))
@@ -0,0 +1,199 @@
+import hashlib
+import io
+import random
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from website import cache, search
+from website.models import Customer, Order, PaymentType, Product, ProductOpinion, ProductOrder, ProductType
+from website.photos import generate_renditions
+
+
+ADJECTIVES = [
+    'vintage', 'handmade', 'wooden', 'electric', 'organic', 'portable', 'waterproof', 'giant', 'tiny', 'solar',
+    'leather', 'woolly', 'polished', 'rustic', 'glow-in-the-dark', 'ergonomic', 'folding', 'llama-themed',
+]
+NOUNS = [
+    'desk fan', 'running shoes', 't-shirt', 'gummy bears', 'lamp', 'backpack', 'guitar', 'teapot', 'bicycle',
+    'blanket', 'notebook', 'skateboard', 'camera', 'umbrella', 'headphones', 'sweater', 'bookshelf', 'kite',
+]
+CITIES = ['Nashville', 'Memphis', 'Knoxville', 'Chattanooga', 'Louisville', 'Atlanta', None]
+CARDS = ['Visa', 'MasterCard', 'AMEX', 'Discover']
+
+# every generated user can log in with this password
+PASSWORD = 'password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills an empty database with a reproducible synthetic storefront: users, customers, product types, '
+        'products (some with photos), payment types, past orders and opinions. The same --seed and --scale '
+        'always produce the same data. Generated shoppers are shopper<n> and sellers seller<n>, all with the '
+        'password "{}".'.format(PASSWORD)
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='random seed')
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='size multiplier; 1 is 200 users, 2000 products and about 1000 orders')
+        parser.add_argument('--photo-fraction', type=float, default=0.05, help='share of products given a photo')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username='seller0').exists():
+            raise CommandError('Generated data is already present; run generate_data on an empty database')
+
+        self.random = random.Random(options['seed'])
+        scale = options['scale']
+        self.now = timezone.make_aware(datetime(2017, 6, 1))
+
+        counts = {
+            'users': max(2, int(200 * scale)),
+            'product_types': max(1, int(20 * scale ** 0.5)),
+            'products': max(1, int(2000 * scale)),
+        }
+
+        with transaction.atomic():
+            sellers, shoppers = self._users(counts['users'])
+            product_types = self._product_types(counts['product_types'])
+            products = self._products(counts['products'], sellers, product_types)
+            payment_types = self._payment_types(shoppers)
+            orders = self._orders(shoppers, payment_types, products)
+            opinions = self._opinions(shoppers, products)
+
+        photos = self._photos(products, options['photo_fraction'])
+
+        # bulk_create sends no save signals; bring the derived data up to date in one go
+        call_command('recompute_ratings', stdout=io.StringIO())
+        call_command('backfill_order_snapshots', stdout=io.StringIO())
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+        search.get_backend().rebuild()
+        cache.bump_catalog_version()
+
+        self.stdout.write(
+            'Generated {} sellers, {} shoppers, {} product types, {} products ({} with photos), {} payment types, '
+            '{} orders and {} opinions'.format(
+                len(sellers), len(shoppers), len(product_types), len(products), photos,
+                sum(len(ids) for ids in payment_types.values()),
+                orders, opinions))
+
+    def _users(self, count):
+        password = make_password(PASSWORD)
+        seller_count = max(1, count // 10)
+        usernames = ['seller{}'.format(i) for i in range(seller_count)]
+        usernames += ['shopper{}'.format(i) for i in range(count - seller_count)]
+        User.objects.bulk_create([
+            User(
+                username=username, password=password, email='{}@example.com'.format(username),
+                first_name=username.capitalize(), last_name='Llama',
+                date_joined=self.now - timedelta(days=self.random.randint(30, 720)),
+            )
+            for username in usernames
+        ])
+
+        users = list(User.objects.filter(username__in=usernames).order_by('pk'))
+        Customer.objects.bulk_create([
+            Customer(user=user, phone=self.random.randint(5550000, 5559999),
+                     street_address='{} Main St'.format(self.random.randint(1, 999)))
+            for user in users
+        ])
+        return users[:seller_count], users[seller_count:]
+
+    def _product_types(self, count):
+        names = [noun.title() for noun in NOUNS]
+        ProductType.objects.bulk_create([
+            ProductType(product_type_name=names[i] if i < len(names) else '{} {}'.format(names[i % len(names)], i))
+            for i in range(count)
+        ])
+        return list(ProductType.objects.order_by('pk'))
+
+    def _products(self, count, sellers, product_types):
+        products = []
+        for i in range(count):
+            adjective, noun = self.random.choice(ADJECTIVES), self.random.choice(NOUNS)
+            seller = self.random.choice(sellers)
+            products.append(Product(
+                seller=seller,
+                product_type=self.random.choice(product_types),
+                title='{} {}'.format(adjective, noun).capitalize(),
+                description='A {} {} from {}\'s shop, item {}.'.format(adjective, noun, seller.username, i),
+                price='{}.{:02d}'.format(self.random.randint(1, 300), self.random.randint(0, 99)),
+                # plenty of stock, so load tests can keep checking out
+                quantity=self.random.randint(100, 10000),
+                city=self.random.choice(CITIES),
+            ))
+        Product.objects.bulk_create(products)
+        return list(Product.objects.filter(seller__in=sellers).order_by('pk').values_list('pk', flat=True))
+
+    def _payment_types(self, shoppers):
+        PaymentType.objects.bulk_create([
+            PaymentType(payment_type_name=self.random.choice(CARDS),
+                        account_number=self.random.randint(1000, 9999), customer=shopper)
+            for shopper in shoppers for _ in range(self.random.randint(1, 2))
+        ])
+        payment_types = {}
+        for pk, customer_id in PaymentType.objects.filter(customer__in=shoppers).order_by('pk').values_list('pk', 'customer'):
+            payment_types.setdefault(customer_id, []).append(pk)
+        return payment_types
+
+    def _orders(self, shoppers, payment_types, products):
+        orders = []
+        for shopper in shoppers:
+            for _ in range(self.random.randint(0, 10)):
+                orders.append(Order(
+                    customer=shopper, active=False, payment_type_id=self.random.choice(payment_types[shopper.pk]),
+                    order_date=self.now - timedelta(minutes=self.random.randint(1, 365 * 24 * 60)),
+                ))
+        Order.objects.bulk_create(orders)
+
+        lines = []
+        order_ids = Order.objects.filter(customer__in=shoppers).order_by('pk').values_list('pk', flat=True)
+        for order_id in order_ids.iterator():
+            for product_id in self.random.sample(products, min(len(products), self.random.randint(1, 4))):
+                lines.append(ProductOrder(order_id=order_id, product_id=product_id,
+                                          quantity=self.random.choice([1, 1, 1, 2, 3])))
+            if len(lines) >= 1000:
+                ProductOrder.objects.bulk_create(lines)
+                lines = []
+        ProductOrder.objects.bulk_create(lines)
+        return len(orders)
+
+    def _opinions(self, shoppers, products):
+        opinions = [
+            ProductOpinion(product_id=product_id, customer=shopper, opinion=self.random.choice([1, 1, 1, -1]))
+            for shopper in shoppers
+            for product_id in self.random.sample(products, min(len(products), self.random.randint(0, 8)))
+        ]
+        ProductOpinion.objects.bulk_create(opinions)
+        return len(opinions)
+
+    def _photos(self, products, fraction):
+        photo_products = [product_id for product_id in products if self.random.random() < fraction]
+        if not photo_products:
+            return 0
+
+        # a handful of distinct photos shared between products, stored under content-hashed names
+        # as website.photos.normalize_photo would store them
+        names = []
+        for i in range(8):
+            photo = io.BytesIO()
+            color = (self.random.randint(0, 255), self.random.randint(0, 255), self.random.randint(0, 255))
+            Image.new('RGB', (800, 600), color).save(photo, 'JPEG', quality=85)
+            digest = hashlib.sha256(photo.getvalue()).hexdigest()
+            name = 'products/{}/{}.jpg'.format(digest[:2], digest)
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(photo.getvalue()))
+            names.append(name)
+
+        for product_id in photo_products:
+            Product.objects.filter(pk=product_id).update(product_photo=self.random.choice(names))
+            generate_renditions(product_id)
+        return len(photo_products)
@@ -0,0 +1,156 @@
+import io
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from website import cache, search
+from website.catalog_io import CATALOG_MODELS, format_for, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads users, product types or products from a JSON Lines or CSV file, streaming it in batches. '
+        'Import users, then product types, then products; products may name their seller by username and '
+        'their product type by name instead of giving seller_id/product_type_id.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(CATALOG_MODELS), help='what the file holds')
+        parser.add_argument('path', help="the file to read, or '-' for standard input")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='defaults to csv for .csv files, else jsonl')
+        parser.add_argument('--batch-size', type=int, default=1000, help='rows written per transaction')
+
+    def handle(self, *args, **options):
+        catalog_model = CATALOG_MODELS[options['kind']]
+        self.catalog_model = catalog_model
+        self.model = catalog_model.model
+        self.lookups = self._lookups(catalog_model)
+        self.imported = self.skipped = self.invalid = 0
+        self.explicit_ids = False
+
+        path = options['path']
+        try:
+            file = sys.stdin if path == '-' else io.open(path, encoding='utf-8', newline='')
+        except IOError as e:
+            raise CommandError('Cannot read {}: {}'.format(path, e))
+        started = time.time()
+        try:
+            batch = []
+            for line_number, row in read_rows(file, format_for(path, options['format'])):
+                cleaned = self._clean(line_number, row)
+                if cleaned is None:
+                    continue
+                batch.append(cleaned)
+                if len(batch) >= options['batch_size']:
+                    self._write(batch)
+                    batch = []
+                    self._progress(started, options['verbosity'] > 1)
+            if batch:
+                self._write(batch)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        if self.explicit_ids:
+            # rows kept the ids they were given, so move the id sequence past them (PostgreSQL)
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [self.model]):
+                    cursor.execute(sql)
+
+        if options['kind'] != 'users':
+            # bulk_create sends no save signals, so refresh what website.signals would have
+            search.get_backend().rebuild()
+            cache.bump_catalog_version()
+
+        self._progress(started, True)
+
+    def _lookups(self, catalog_model):
+        # referenced rows, loaded once: name -> id (first by id wins for duplicate names) and the set of ids
+        lookups = {}
+        for column, (name_column, model, key) in catalog_model.references.items():
+            by_name, ids = {}, set()
+            for pk, name in model.objects.order_by('pk').values_list('pk', key).iterator():
+                by_name.setdefault(name, pk)
+                ids.add(pk)
+            lookups[column] = (by_name, ids)
+        return lookups
+
+    def _clean(self, line_number, row):
+        if isinstance(row, ValueError):
+            return self._reject(line_number, [str(row)])
+
+        errors = []
+        row = dict(row)
+        for column, (name_column, model, key) in self.catalog_model.references.items():
+            by_name, ids = self.lookups[column]
+            if row.get(column) not in (None, ''):
+                try:
+                    row[column] = int(row[column])
+                except (TypeError, ValueError):
+                    row[column] = None
+                if row[column] not in ids:
+                    errors.append('{}: no {} with id {}'.format(column, model._meta.verbose_name, row.get(column)))
+            elif row.get(name_column) not in (None, ''):
+                row[column] = by_name.get(row[name_column])
+                if row[column] is None:
+                    errors.append('{}: no {} named {!r}'.format(name_column, model._meta.verbose_name, row[name_column]))
+            else:
+                errors.append('{}: give either {} or {}'.format(name_column, column, name_column))
+
+        try:
+            cleaned = self.catalog_model.clean(row)
+        except ValidationError as e:
+            errors.extend(e.messages)
+
+        if errors:
+            return self._reject(line_number, errors)
+        return cleaned
+
+    def _reject(self, line_number, errors):
+        self.invalid += 1
+        self.stderr.write('line {}: {}'.format(line_number, '; '.join(errors)))
+        return None
+
+    def _write(self, batch):
+        with transaction.atomic():
+            batch = self._without_existing(batch)
+            if not batch:
+                return
+            self.model.objects.bulk_create([self.catalog_model.build(cleaned) for cleaned in batch])
+            self.catalog_model.created(batch)
+        self.imported += len(batch)
+
+    def _without_existing(self, batch):
+        # rows whose id or other unique value is already taken (in the database or earlier in the batch)
+        # are skipped, so an interrupted import can simply be run again
+        unique_fields = [field.attname for field in self.model._meta.fields if field.unique]
+        for name in unique_fields:
+            values = [cleaned[name] for cleaned in batch if cleaned.get(name) is not None]
+            if not values:
+                continue
+            if name == self.model._meta.pk.attname:
+                self.explicit_ids = True
+            taken = set(self.model.objects.filter(**{name + '__in': values}).values_list(name, flat=True))
+            kept = []
+            for cleaned in batch:
+                value = cleaned.get(name)
+                if value is not None and value in taken:
+                    self.skipped += 1
+                    continue
+                taken.add(value)
+                kept.append(cleaned)
+            batch = kept
+        return batch
+
+    def _progress(self, started, show):
+        if not show:
+            return
+        elapsed = max(time.time() - started, 1e-6)
+        self.stdout.write('{}: {} imported, {} already present, {} invalid in {:.1f}s ({:.0f} rows/sec)'.format(
+            self.model._meta.verbose_name_plural, self.imported, self.skipped, self.invalid, elapsed,
+            (self.imported + self.skipped + self.invalid) / elapsed,
+        ))
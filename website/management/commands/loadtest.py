@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from website.management.benchutils import percentile
+from website.models import Order, PaymentType, Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays shopper journeys (index, search, single_product, add to cart, cart and, for some journeys, '
+        'checkout) against the WSGI application in-process, from several threads at once, and reports '
+        'throughput and latency percentiles per view. Run generate_data first; each thread shops as a '
+        'different generated shopper. Requests go through the full middleware stack except CSRF checks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='shoppers browsing at the same time')
+        parser.add_argument('--journeys', type=int, default=20, help='journeys each shopper makes')
+        parser.add_argument('--checkout-rate', type=float, default=0.3, help='share of journeys that check out')
+        parser.add_argument('--seed', type=int, default=1, help='random seed for the journeys')
+        parser.add_argument('--host', help='Host header to send; defaults to the first plain name in ALLOWED_HOSTS')
+
+    def handle(self, *args, **options):
+        shoppers = list(User.objects.filter(username__startswith='shopper', paymenttype__isnull=False)
+                        .distinct().order_by('pk')[:options['concurrency']])
+        product_ids = list(Product.objects.filter(quantity__gt=0).order_by('pk').values_list('pk', flat=True))
+        if len(shoppers) < options['concurrency'] or not product_ids:
+            raise CommandError('Not enough shoppers or products to load test with; run generate_data first')
+        sample = random.Random(options['seed']).sample(product_ids, min(len(product_ids), 200))
+        titles = Product.objects.filter(pk__in=sample).values_list('title', flat=True)
+        words = sorted({word.lower() for title in titles for word in title.split() if len(word) > 3})
+
+        if not options['host']:
+            names = [host for host in settings.ALLOWED_HOSTS if '*' not in host and not host.startswith('.')]
+            options['host'] = names[0] if names else 'localhost'
+
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        workers = [
+            (shopper, random.Random(options['seed'] * 1000 + i), product_ids, words, options)
+            for i, shopper in enumerate(shoppers)
+        ]
+
+        started = time.perf_counter()
+        if len(workers) == 1:
+            # on the calling thread, so it shares this thread's database connection and transaction
+            self._shop(*workers[0])
+        else:
+            threads = [threading.Thread(target=self._run_worker, args=worker) for worker in workers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+
+        self._report(elapsed)
+
+    def _run_worker(self, *worker):
+        try:
+            self._shop(*worker)
+        finally:
+            connection.close()
+
+    def _shop(self, shopper, rng, product_ids, words, options):
+        client = Client(HTTP_HOST=options['host'])
+        client.force_login(shopper)
+        payment_type_id = PaymentType.objects.filter(customer=shopper).values_list('pk', flat=True).first()
+
+        for _ in range(options['journeys']):
+            product_id = rng.choice(product_ids)
+            self._request(client, 'index', 'get', '/')
+            self._request(client, 'search', 'get', '/search/', {'q': rng.choice(words)})
+            self._request(client, 'single_product', 'get', '/single_product/{}/'.format(product_id))
+            self._request(client, 'add_product_to_order', 'post', '/add_to_cart/{}/'.format(product_id))
+            self._request(client, 'cart', 'get', '/cart')
+
+            if rng.random() < options['checkout_rate']:
+                order_id = Order.objects.filter(customer=shopper, active=True).values_list('pk', flat=True).first()
+                if order_id is None:
+                    continue
+                self._request(client, 'checkout', 'post', '/checkout/{}/'.format(order_id))
+                self._request(client, 'order_confirmation', 'post', '/order_confirmation',
+                              {'order_id': order_id, 'payment_type_id': payment_type_id})
+
+    def _request(self, client, name, method, path, data=None):
+        started = time.perf_counter()
+        try:
+            status = getattr(client, method)(path, data or {}).status_code
+        except Exception:
+            # the test client re-raises exceptions from views; count them as server errors
+            status = 500
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.timings[name].append(elapsed)
+            if status >= 400:
+                self.errors[name] += 1
+
+    def _report(self, elapsed):
+        total = sum(len(timings) for timings in self.timings.values())
+        self.stdout.write('{} requests in {:.1f}s, {:.1f} requests/sec'.format(total, elapsed, total / elapsed))
+        self.stdout.write('{:<22} {:>8} {:>7} {:>9} {:>8} {:>8} {:>8} {:>8}'.format(
+            'view', 'requests', 'errors', 'req/sec', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+        for name in ('index', 'search', 'single_product', 'add_product_to_order', 'cart', 'checkout',
+                     'order_confirmation'):
+            timings = self.timings.get(name)
+            if not timings:
+                continue
+            self.stdout.write('{:<22} {:>8} {:>7} {:>9.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f}'.format(
+                name, len(timings), self.errors[name], len(timings) / elapsed, percentile(timings, 0.5),
+                percentile(timings, 0.9), percentile(timings, 0.99), max(timings)))
@@ -0,0 +1,68 @@
+import datetime
+import heapq
+import itertools
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+from website.models import ArchivedOrderLine, ProductOrder, SellerDailySales
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the SellerDailySales rollup behind the sales dashboard from the completed orders, e.g. after '
+        'importing order history. Checkouts keep it up to date after that.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='only rebuild the days from this date (YYYY-MM-DD) on')
+        parser.add_argument('--batch-size', type=int, default=1000, help='rollup rows inserted per statement')
+
+    def handle(self, *args, **options):
+        # whole days in the current time zone, as checkouts record them, at the prices the lines were sold at
+        # (or, for lines not yet backfilled by backfill_order_snapshots, today's)
+        lines = ProductOrder.objects.filter(order__active=False, order__order_date__isnull=False).annotate(
+            day=TruncDate('order__order_date'))
+        archived_lines = ArchivedOrderLine.objects.annotate(day=TruncDate('order__order_date'))
+        rollup = SellerDailySales.objects.all()
+        if options['since']:
+            try:
+                since = datetime.datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be a date like 2017-06-30')
+            lines = lines.filter(day__gte=since)
+            archived_lines = archived_lines.filter(day__gte=since)
+            rollup = rollup.filter(day__gte=since)
+
+        sales = self._sales(lines, Coalesce('unit_price', 'product__price'))
+        archived_sales = self._sales(archived_lines, F('unit_price'))
+
+        rows = 0
+        with transaction.atomic():
+            rollup.delete()
+            batch = []
+            # a day's sales can be split between live and archived orders; both come sorted, so merge them
+            for (day, seller_id, product_id), same in itertools.groupby(
+                    heapq.merge(sales, archived_sales), key=lambda sale: sale[:3]):
+                same = list(same)
+                batch.append(SellerDailySales(
+                    seller_id=seller_id, product_id=product_id, day=day,
+                    units=sum(sale[3] for sale in same), revenue=sum(sale[4] for sale in same)))
+                if len(batch) == options['batch_size']:
+                    SellerDailySales.objects.bulk_create(batch)
+                    rows += len(batch)
+                    batch = []
+            SellerDailySales.objects.bulk_create(batch)
+            rows += len(batch)
+
+        self.stdout.write('Rebuilt {} seller daily sales rows'.format(rows))
+
+    def _sales(self, lines, unit_price):
+        # (day, seller id, product id, units, revenue) per seller, product and day, in that order
+        return (lines.values_list('day', 'product__seller', 'product')
+                .annotate(units=Sum('quantity'),
+                          revenue=Sum(F('quantity') * unit_price, output_field=DecimalField()))
+                .order_by('day', 'product__seller', 'product')
+                .iterator())
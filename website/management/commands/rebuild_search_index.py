@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from website import search
+from website.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-indexes every product for the search box. migrate only builds the index when it is new or empty; '
+        'run this after changing the product table outside the ORM, e.g. with raw SQL or a restored backup.'
+    )
+
+    def handle(self, *args, **options):
+        search.get_backend().rebuild()
+        self.stdout.write('Indexed {} products for search'.format(Product.objects.count()))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from website.models import Product, ProductOpinion
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every product\'s likes and dislikes counters from the ProductOpinion table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='products updated per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Product.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+
+        repaired = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                repaired += Product.objects.filter(pk__gt=start, pk__lte=start + batch_size).update(
+                    likes=self._opinion_count(opinion__gt=0),
+                    dislikes=self._opinion_count(opinion__lt=0),
+                )
+
+        self.stdout.write('Recomputed ratings for {} products'.format(repaired))
+
+    def _opinion_count(self, **opinion):
+        count = (ProductOpinion.objects.filter(product=OuterRef('pk'), **opinion)
+                 .order_by().values('product').annotate(count=Count('pk')).values('count'))
+        return Coalesce(Subquery(count, output_field=IntegerField()), 0)
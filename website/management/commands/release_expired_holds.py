@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import IntegerField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from website.models import Product, ProductOrder, StockShard
+
+
+class Command(BaseCommand):
+    help = (
+        'Gives the units held by cart lines whose hold has expired (see STOCK_HOLD_SECONDS) back to stock. '
+        'Run it every minute or so, e.g. from cron. The expired lines stay in their carts; checking them out '
+        'takes whatever stock is still free.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='cart lines released per transaction')
+        parser.add_argument('--recount', action='store_true',
+                            help='also recompute every product\'s reserved counter from the cart lines\' holds')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        lines = units = 0
+        while True:
+            with transaction.atomic():
+                batch = list(ProductOrder.objects.expired_holds(now).select_for_update().order_by('pk')
+                             .values_list('pk', flat=True)[:options['batch_size']])
+                if not batch:
+                    break
+                units += ProductOrder.objects.filter(pk__in=batch).release()
+            lines += len(batch)
+        self.stdout.write('Released {} units held by {} expired cart lines'.format(units, lines))
+
+        if options['recount']:
+            self.stdout.write('Recounted the holds on {} products'.format(self._recount()))
+
+    def _recount(self):
+        # repairs counters left wrong by lines deleted without being released, e.g. with their user
+        held = (ProductOrder.objects.filter(product=OuterRef('pk'), reserved__gt=0)
+                .order_by().values('product').annotate(held=Sum('reserved')).values('held'))
+        last_id = Product.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+        recounted = 0
+        for start in range(0, last_id, 10000):
+            with transaction.atomic():
+                recounted += Product.objects.filter(pk__gt=start, pk__lte=start + 10000, stock_shards=0).update(
+                    reserved=Coalesce(Subquery(held, output_field=IntegerField()), 0))
+
+        # sharded products count their holds in their shards
+        held_in_shard = (ProductOrder.objects.filter(product=OuterRef('product'), shard=OuterRef('number'),
+                                                     reserved__gt=0)
+                         .order_by().values('product').annotate(held=Sum('reserved')).values('held'))
+        with transaction.atomic():
+            StockShard.objects.update(reserved=Coalesce(Subquery(held_in_shard, output_field=IntegerField()), 0))
+            recounted += StockShard.objects.consolidate()
+        return recounted
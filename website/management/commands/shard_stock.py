@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from website.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Splits a product\'s stock over a number of counter rows, so simultaneous checkouts of a bestseller '
+        'update different rows instead of queueing on one, or with 0 shards moves it back into the product row. '
+        'Run consolidate_stock periodically to keep the product\'s own stock columns up to date.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('shards', type=int, help='number of counter rows; 0 to stop sharding')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 256:
+            raise CommandError('shards must be between 0 and 256')
+        try:
+            product = Product.objects.get(pk=options['product_id'])
+        except Product.DoesNotExist:
+            raise CommandError('No product with id {}'.format(options['product_id']))
+
+        product.shard_stock(options['shards'])
+        self.stdout.write('{} now has its stock in {}'.format(
+            product, '{} shards'.format(options['shards']) if options['shards'] else 'the product row'))
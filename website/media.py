@@ -0,0 +1,127 @@
+"""
+Serving of uploaded media (product photos and their resized copies).
+
+Product photos and renditions are stored under names derived from a hash
+of their content (see website.photos), so a given URL never changes what it
+points at and can be cached by browsers and proxies forever. Names without
+a hash, such as photos loaded from fixtures, get a short cache lifetime.
+
+When MEDIA_SENDFILE_HEADER is set ('X-Accel-Redirect' for nginx,
+'X-Sendfile' for Apache/lighttpd) the file itself is left to the front
+server; otherwise it is streamed with FileResponse, which WSGI servers that
+provide wsgi.file_wrapper send with sendfile().
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.static import was_modified_since
+
+
+HASHED_NAME = re.compile(r'^(?P<digest>[0-9a-f]{32,64})\.\w+$')
+RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _etag(path, stat):
+    hashed = HASHED_NAME.match(os.path.basename(path))
+    if hashed:
+        return '"{}"'.format(hashed.group('digest'))
+    return '"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size)
+
+
+def _byte_range(header, size):
+    # a single "bytes=start-end" range as (start, end) inclusive, None to send the whole file,
+    # or False when the range can't be satisfied
+    match = RANGE.match(header or '')
+    if not match or not (match.group('start') or match.group('end')):
+        return None
+    if not match.group('start'):
+        start, end = max(size - int(match.group('end')), 0), size - 1
+    else:
+        start = int(match.group('start'))
+        end = min(int(match.group('end')), size - 1) if match.group('end') else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(file, start, length, block_size=64 * 2 ** 10):
+    try:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+def serve_media(request, path):
+    """
+    Purpose: To serve an uploaded file with long-lived caching headers, ETag/304 and byte range support
+    Args: request -- the full HTTP request object, path -- the file's path below MEDIA_ROOT
+    Returns: the file, a 304 when the browser's copy is current, or a 206 with the requested byte range
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Media not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Media not found')
+
+    stat = os.stat(full_path)
+    etag = _etag(full_path, stat)
+    cache_control = IMMUTABLE if HASHED_NAME.match(os.path.basename(full_path)) else 'public, max-age=3600'
+
+    def with_caching_headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        if etag in parse_etags(if_none_match) or if_none_match.strip() == '*':
+            return with_caching_headers(HttpResponseNotModified())
+    elif not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime, stat.st_size):
+        return with_caching_headers(HttpResponseNotModified())
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    sendfile_header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if sendfile_header:
+        # the front server reads the file (and handles Range) itself
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header == 'X-Accel-Redirect':
+            response[sendfile_header] = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/') + path
+        else:
+            response[sendfile_header] = full_path
+        return with_caching_headers(response)
+
+    byte_range = _byte_range(request.META.get('HTTP_RANGE'), stat.st_size)
+    if byte_range is False:
+        response = with_caching_headers(HttpResponse(status=416))
+        response['Content-Range'] = 'bytes */{}'.format(stat.st_size)
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(open(full_path, 'rb'), start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, stat.st_size)
+        response['Content-Length'] = end - start + 1
+        return with_caching_headers(response)
+
+    response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    response['Content-Length'] = stat.st_size
+    return with_caching_headers(response)
@@ -1,7 +1,11 @@
 import datetime
+import random
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.core.urlresolvers import reverse
 from django.utils import timezone
 from sorl.thumbnail import ImageField
@@ -21,6 +25,32 @@ class ProductType(models.Model):
     def get_absolute_url(self):
         return "/product_type_products/{}".format(self.id)
 
+class ProductQuerySet(models.QuerySet):
+    """
+    purpose: Reusable product lookups shared by the catalog views
+    args: Extends the models.QuerySet Django class
+    returns: (None): N/A
+    """
+
+    def newest_per_type(self, per_type=3):
+        """
+        purpose: Selects the newest `per_type` products of every product type in a single query
+        args: per_type: (integer): how many products to keep for each product type
+        returns: (QuerySet): products ordered by product type, newest first
+        """
+        newest_of_type = Product.objects.filter(
+            product_type=OuterRef('product_type')).order_by('-pk').values('pk')[:per_type]
+        return self.filter(pk__in=Subquery(newest_of_type)).order_by('product_type', '-pk')
+
+    def adjust_ratings(self, likes=0, dislikes=0):
+        """
+        purpose: Moves the like and dislike counters of every product in the queryset in one atomic update
+        args: likes: (integer): amount to add to likes, dislikes: (integer): amount to add to dislikes
+        returns: (integer): number of products updated
+        """
+        return self.update(likes=F('likes') + likes, dislikes=F('dislikes') + dislikes)
+
+
 class Product(models.Model):
     """
     purpose: Instantiates a product
@@ -38,8 +68,26 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2, null=False)
     quantity = models.IntegerField()
     quantity_sold = models.IntegerField(default=0)
+    # units held in shoppers' carts, see ProductOrderQuerySet.add_product; only quantity - reserved can be added
+    reserved = models.IntegerField(default=0)
+    # 0: the stock is counted in this row; N: it is split over N StockShard rows, so simultaneous checkouts of a
+    # bestseller update different rows, and quantity, quantity_sold and reserved here are totals of the shards
+    # as of the last consolidate_stock (see Product.shard_stock)
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     product_photo = models.ImageField(blank=True, null=True) 
     city = models.CharField(max_length=255, blank=True, null=True)
+    # running totals of the product's ProductOpinion rows, see ProductQuerySet.adjust_ratings
+    likes = models.IntegerField(default=0, db_index=True)
+    dislikes = models.IntegerField(default=0)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # user_products and get_product_types page newest first within a seller / product type
+            models.Index(fields=['seller', '-id'], name='product_seller_newest_idx'),
+            models.Index(fields=['product_type', '-id'], name='product_type_newest_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -47,6 +95,232 @@ class Product(models.Model):
     def get_absolute_url(self):
         return "/single_product/{}".format(self.id)
 
+    @property
+    def available(self):
+        """
+        purpose: The units that can still be added to a cart: those in stock and not held in another cart
+        args: None
+        returns: (integer): quantity less reserved, added up from the stock shards when the stock is sharded
+        """
+        if self.stock_shards:
+            return self.shards.available()
+        return self.quantity - self.reserved
+
+    def shard_stock(self, shards):
+        """
+        purpose: Splits the product's stock over a number of StockShard rows, or with 0 moves it back into the
+            product row. Units on sale are shared out evenly; the units sold and held in carts go to shard 0
+        args: shards: (integer): the number of shards, 0 for none
+        returns: (None): N/A
+        """
+        with transaction.atomic():
+            list(Product.objects.select_for_update().filter(pk=self.pk).values_list('pk'))
+            StockShard.objects.consolidate(Product.objects.filter(pk=self.pk))
+            self.refresh_from_db(fields=['quantity', 'quantity_sold', 'reserved', 'stock_shards'])
+            self.shards.all().delete()
+
+            self.stock_shards = shards
+            self.save(update_fields=['stock_shards'])
+            ProductOrder.objects.filter(product=self, reserved__gt=0).update(shard=0 if shards else None)
+            if not shards:
+                return
+
+            share, remainder = divmod(self.quantity - self.reserved, shards)
+            StockShard.objects.bulk_create([StockShard(
+                product=self, number=number, quantity=share + (remainder + self.reserved if number == 0 else 0),
+                quantity_sold=self.quantity_sold if number == 0 else 0, reserved=self.reserved if number == 0 else 0,
+            ) for number in range(shards)])
+
+    @property
+    def photo_renditions(self):
+        """
+        purpose: The pre-generated resized copies of the product photo, by rendition name
+        args: None
+        returns: (dict): ProductPhotoRendition by name, e.g. photo_renditions['detail']; prefetch
+            'renditions' when listing many products
+        """
+        return {rendition.name: rendition for rendition in self.renditions.all()}
+
+
+def _shard_order(shards, first=None):
+    # every shard number once, from a random one so simultaneous checkouts spread over the shards
+    start = random.randrange(shards)
+    numbers = [(start + i) % shards for i in range(shards)]
+    if first is not None:
+        numbers.remove(first)
+        numbers.insert(0, first)
+    return numbers
+
+
+class StockShardQuerySet(models.QuerySet):
+    """
+    purpose: Holds, sales and totals of sharded stock; each method touches one shard row where it can
+    args: Extends the models.QuerySet Django class
+    returns: (None): N/A
+    """
+
+    def available(self):
+        """
+        purpose: Adds up the units on sale and not held in carts across the shards in the queryset
+        args: None
+        returns: (integer): the units that can still be added to a cart
+        """
+        return self.aggregate(available=Sum(F('quantity') - F('reserved')))['available'] or 0
+
+    def hold(self, product_id, shards, units, line_shard=None, line_held=0):
+        """
+        purpose: Holds units of a sharded product for a cart line, in the shard already holding the line's units
+            if it has room, else moving the line's whole hold to a shard that has
+        args: product_id: (integer): the product, shards: (integer): its number of shards, units: (integer): the
+            units to hold, line_shard: (integer): the shard holding the line's units, if any, line_held:
+            (integer): the units it holds there
+        returns: (integer): the number of the shard now holding all the line's units
+        raises: OutOfStock: when fewer units are free across all the shards
+        """
+        for number in _shard_order(shards, line_shard):
+            moved = 0 if number == line_shard else line_held
+            if self.filter(product_id=product_id, number=number,
+                           quantity__gte=F('reserved') + moved + units).update(reserved=F('reserved') + moved + units):
+                if moved:
+                    self.filter(product_id=product_id, number=line_shard).update(reserved=F('reserved') - moved)
+                return number
+
+        # no one shard has the units free; move free units from the others into the line's shard
+        number = 0 if line_shard is None else line_shard
+        if not self.gather(product_id, number, units):
+            raise OutOfStock(product_id)
+        self.filter(product_id=product_id, number=number).update(reserved=F('reserved') + units)
+        return number
+
+    def sell(self, product_id, shards, units, line_shard=None, held=0):
+        """
+        purpose: Takes units of a sharded product out of stock for a checkout, from the shard holding them for
+            the line when it can, else from any shards with the units free
+        args: product_id: (integer): the product, shards: (integer): its number of shards, units: (integer): the
+            units sold, line_shard: (integer): the shard holding units for the line, if any, held: (integer): the
+            units it holds
+        returns: (None): N/A
+        raises: OutOfStock: when fewer units are free across all the shards
+        """
+        sale = {'quantity': F('quantity') - units, 'quantity_sold': F('quantity_sold') + units}
+        if line_shard is not None and self.filter(
+                product_id=product_id, number=line_shard, quantity__gte=F('reserved') - held + units).update(
+                reserved=F('reserved') - held, **sale):
+            return
+
+        # the hold lapsed and the shard sold out meanwhile: give the hold back and sell from whichever shard can
+        if held:
+            self.filter(product_id=product_id, number=line_shard).update(reserved=F('reserved') - held)
+        for number in _shard_order(shards):
+            if self.filter(product_id=product_id, number=number, quantity__gte=F('reserved') + units).update(**sale):
+                return
+
+        # no one shard has the units free; move free units from the others into one
+        number = 0 if line_shard is None else line_shard
+        if not self.gather(product_id, number, units):
+            raise OutOfStock(product_id)
+        self.filter(product_id=product_id, number=number).update(**sale)
+
+    def gather(self, product_id, number, units):
+        """
+        purpose: Moves free units of a sharded product from its other shards into one, until that one has enough
+            free; every shard of the product is locked while this happens
+        args: product_id: (integer): the product, number: (integer): the shard to fill, units: (integer): the
+            free units it needs
+        returns: (boolean): whether there were enough free units across the shards
+        """
+        free = dict((shard, quantity - reserved) for shard, quantity, reserved in self.select_for_update().filter(
+            product_id=product_id).order_by('number').values_list('number', 'quantity', 'reserved'))
+        missing = units - free[number]
+        if missing <= 0:
+            return True
+        if sum(units_free for shard, units_free in free.items() if shard != number and units_free > 0) < missing:
+            return False
+
+        gathered = 0
+        for shard, units_free in free.items():
+            if shard == number or units_free <= 0:
+                continue
+            moved = min(units_free, missing - gathered)
+            self.filter(product_id=product_id, number=shard).update(quantity=F('quantity') - moved)
+            gathered += moved
+            if gathered == missing:
+                break
+        self.filter(product_id=product_id, number=number).update(quantity=F('quantity') + gathered)
+        return True
+
+    def rebalance(self, product_id):
+        """
+        purpose: Shares a sharded product's free units out evenly over its shards again, leaving every hold
+            where it is
+        args: product_id: (integer): the product
+        returns: (None): N/A
+        """
+        with transaction.atomic():
+            shards = list(self.select_for_update().filter(product_id=product_id).order_by('number').values_list(
+                'number', 'quantity', 'reserved'))
+            share, remainder = divmod(sum(quantity - reserved for number, quantity, reserved in shards), len(shards))
+            for i, (number, quantity, reserved) in enumerate(shards):
+                self.filter(product_id=product_id, number=number).update(
+                    quantity=reserved + share + (1 if i < remainder else 0))
+
+    def consolidate(self, products=None):
+        """
+        purpose: Writes the totals of the shards into their products' quantity, quantity_sold and reserved
+        args: products: (QuerySet): the products to consolidate, by default every sharded product
+        returns: (integer): the number of products updated
+        """
+        products = (Product.objects.all() if products is None else products).filter(stock_shards__gt=0)
+
+        def total(field):
+            shards = self.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+                total=Sum(field)).values('total')
+            return Subquery(shards, output_field=models.IntegerField())
+
+        return products.update(
+            quantity=total('quantity'), quantity_sold=total('quantity_sold'), reserved=total('reserved'))
+
+
+class StockShard(models.Model):
+    """
+    purpose: One slice of a product's stock, for products whose stock is sharded (see Product.shard_stock)
+    args: Extends the models.Model Django class
+    returns: (None): N/A
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='shards')
+    number = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+    quantity_sold = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+
+    objects = StockShardQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('product', 'number')
+
+    def __str__(self):
+        return '{} #{}'.format(self.product_id, self.number)
+
+
+class ProductPhotoRendition(models.Model):
+    """
+    purpose: A resized copy of a product photo, generated in the background by website.photos so
+        pages can link straight to it instead of resizing the photo while rendering
+    args: Extends the models.Model Django class
+    returns: (None): N/A
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='renditions')
+    name = models.CharField(max_length=20)
+    image = models.ImageField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('product', 'name')
+
+    def __str__(self):
+        return '{} ({})'.format(self.product, self.name)
+
 
 class Customer(models.Model):
     """
@@ -78,10 +352,34 @@ class PaymentType(models.Model):
 
     class Meta:
         ordering = ('payment_type_name',)
+        indexes = [
+            models.Index(fields=['customer', 'payment_type_name'], name='paymenttype_customer_name_idx'),
+        ]
 
     def __str__(self):
         return self.payment_type_name
 
+class OutOfStock(Exception):
+    """
+    purpose: Raised when checking out an order would sell more units of a product than are in stock
+    args: product_id: (integer): id of the product that ran out
+    returns: (None): N/A
+    """
+
+    def __init__(self, product_id):
+        super(OutOfStock, self).__init__("Product {} is out of stock".format(product_id))
+        self.product_id = product_id
+
+
+def stock_hold_expiry():
+    """
+    purpose: When a cart hold taken now runs out
+    args: None
+    returns: (datetime): now plus the STOCK_HOLD_SECONDS setting
+    """
+    return timezone.now() + datetime.timedelta(seconds=getattr(settings, 'STOCK_HOLD_SECONDS', 15 * 60))
+
+
 class Order(models.Model):
     """
     purpose: Instantiates an order
@@ -94,12 +392,219 @@ class Order(models.Model):
     payment_type = models.ForeignKey(PaymentType, on_delete=models.PROTECT, null=True)
     products = models.ManyToManyField(Product, through="ProductOrder")
     active = models.BooleanField(default=True)
+    # what the order cost, fixed at checkout (see complete)
+    total = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
 
     def __str__(self):
         return str(self.id)
 
     class Meta:
         ordering = ('order_date',)
+        indexes = [
+            # the customer's active order (the cart) is looked up on nearly every cart and checkout request, and
+            # their completed orders are listed by date on the profile page
+            models.Index(fields=['customer', 'active', 'order_date'], name='order_customer_history_idx'),
+        ]
+
+    def complete(self, payment_type):
+        """
+        purpose: Checks out the order in one transaction: turns the order's cart holds into sales, taking every
+            unit on the order out of stock, automatically likes each purchased product for the customer, adds the
+            sales to the sellers' SellerDailySales rows and closes the order. The lines keep the price and title
+            each product had, and the order its total, so the order history doesn't change with the catalog
+        args: payment_type: (PaymentType): the payment type the order is paid with
+        returns: (None): N/A
+        raises: OutOfStock: when a product has fewer units left than the order needs, counting the units the
+            order holds but not those held in other carts; nothing is saved
+        """
+        with transaction.atomic():
+            # lock the lines first, as the hold sweep does, so a hold can't be released while it is being sold
+            lines = ProductOrder.objects.select_for_update().filter(order=self).values_list(
+                'product', 'quantity', 'reserved', 'shard')
+            units_by_product = {product_id: (units, held, shard) for product_id, units, held, shard in lines}
+            products = list(Product.objects.filter(pk__in=units_by_product).values_list(
+                'pk', 'stock_shards', 'seller', 'price', 'title'))
+            sharded = {product_id: shards for product_id, shards, seller_id, price, title in products if shards}
+            sales = [(seller_id, product_id, units_by_product[product_id][0], price * units_by_product[product_id][0])
+                     for product_id, shards, seller_id, price, title in products]
+
+            # lock the products (in id order, so checkouts can't deadlock each other) on backends that support it;
+            # sharded products are left unlocked, so their checkouts only contend on a shard
+            list(Product.objects.select_for_update().filter(pk__in=set(units_by_product) - set(sharded)).order_by(
+                'pk').values_list('pk'))
+
+            for product_id, (units, held, shard) in sorted(units_by_product.items()):
+                if product_id in sharded:
+                    StockShard.objects.sell(product_id, sharded[product_id], units, shard, held)
+                    continue
+                # the units not already held for this order must come from stock no other cart holds
+                sold = Product.objects.filter(pk=product_id, quantity__gte=F('reserved') - held + units).update(
+                    quantity=F('quantity') - units,
+                    quantity_sold=F('quantity_sold') + units,
+                    reserved=F('reserved') - held,
+                )
+                if not sold:
+                    raise OutOfStock(product_id)
+            # one update releases the sold holds and snapshots every line's price and title
+            ProductOrder.objects.filter(order=self).update(
+                reserved=0, reserved_until=None, shard=None,
+                unit_price=Case(*[When(product=product_id, then=Value(price))
+                                  for product_id, shards, seller_id, price, title in products],
+                                output_field=models.DecimalField()),
+                title=Case(*[When(product=product_id, then=Value(title))
+                             for product_id, shards, seller_id, price, title in products],
+                           output_field=models.CharField()))
+
+            # any purchased product is automatically liked
+            ProductOpinion.objects.record_many(sorted(units_by_product), self.customer_id, 1)
+
+            self.payment_type = payment_type
+            self.active = False
+            self.order_date = timezone.now()
+            self.total = sum(revenue for seller_id, product_id, units, revenue in sales)
+            self.save()
+            SellerDailySales.objects.record(timezone.localdate(self.order_date), sales)
+
+    def cancel(self):
+        """
+        purpose: Deletes the order, giving back to stock any units its cart holds, or for a completed order
+            taking its sales back out of SellerDailySales
+        args: None
+        returns: (None): N/A
+        """
+        with transaction.atomic():
+            ProductOrder.objects.filter(order=self).release()
+            if not self.active and self.order_date:
+                # a completed order: take its sales back out of the sellers' rollups
+                # at the prices it was sold at, or today's if backfill_order_snapshots hasn't filled them in
+                lines = ProductOrder.objects.filter(order=self).annotate(line_total=ExpressionWrapper(
+                    Coalesce('unit_price', 'product__price') * F('quantity'), output_field=models.DecimalField()))
+                SellerDailySales.objects.record(timezone.localdate(self.order_date), [
+                    (seller_id, product_id, -units, -line_total)
+                    for seller_id, product_id, units, line_total in lines.values_list(
+                        'product__seller', 'product', 'quantity', 'line_total')])
+            self.delete()
+
+class ProductOrderQuerySet(models.QuerySet):
+    """
+    purpose: Line item and total lookups shared by the cart, checkout and order history views
+    args: Extends the models.QuerySet Django class
+    returns: (None): N/A
+    """
+
+    def line_items(self, order):
+        """
+        purpose: Selects the products on an order along with each product's row
+        args: order: (Order or integer): the order, or its id, to list
+        returns: (QuerySet): the order's ProductOrder rows with their product already joined
+        """
+        return self.filter(order=order).select_related('product').annotate(
+            line_total=ExpressionWrapper(F('product__price') * F('quantity'), output_field=models.DecimalField()))
+
+    def history(self, order):
+        """
+        purpose: Selects the lines of a completed order as they were checked out, without touching the products
+        args: order: (Order or integer): the order, or its id, to list
+        returns: (QuerySet): the order's ProductOrder rows, each with its line_total at the snapshotted unit_price
+        """
+        return self.filter(order=order).annotate(
+            line_total=ExpressionWrapper(F('unit_price') * F('quantity'), output_field=models.DecimalField()))
+
+    def total(self):
+        """
+        purpose: Sums price times quantity of every line in the queryset in the database
+        args: None
+        returns: (Decimal or integer): the total cost, or 0 when there are no lines
+        """
+        return self.aggregate(total=Sum(
+            F('product__price') * F('quantity'), output_field=models.DecimalField()))['total'] or 0
+
+    def add_product(self, order, product, quantity=1):
+        """
+        purpose: Puts units of a product on an order, adding to the order's existing line for that product if it
+            has one, and holds them in stock for the order until STOCK_HOLD_SECONDS from now
+        args: order: (Order): the order to add to, product: (Product): the product being added,
+            quantity: (integer): how many units to add
+        returns: (None): N/A
+        raises: OutOfStock: when fewer units are left than requested, once other carts' holds are counted;
+            the order is left as it was
+        """
+        hold = {'quantity': F('quantity') + quantity, 'reserved': F('reserved') + quantity,
+                'reserved_until': stock_hold_expiry()}
+        with transaction.atomic():
+            # the line, then the product: the order checkout and the hold sweep lock them in
+            if not self.filter(order=order, product=product).update(**hold):
+                try:
+                    with transaction.atomic():
+                        self.create(order=order, product=product, quantity=quantity, reserved=quantity,
+                                    reserved_until=hold['reserved_until'])
+                except IntegrityError:
+                    # another request created the line first
+                    self.filter(order=order, product=product).update(**hold)
+
+            # one conditional update, so simultaneous adds can never hold more units than there are
+            if Product.objects.filter(pk=product.pk, stock_shards=0, quantity__gte=F('reserved') + quantity).update(
+                    reserved=F('reserved') + quantity):
+                return
+
+            shards = Product.objects.filter(pk=product.pk).values_list('stock_shards', flat=True).first()
+            if not shards:
+                raise OutOfStock(product.pk)
+            line_shard, held = self.select_for_update().filter(order=order, product=product).values_list(
+                'shard', 'reserved').get()
+            shard = StockShard.objects.hold(product.pk, shards, quantity, line_shard, held - quantity)
+            self.filter(order=order, product=product).update(shard=shard)
+
+    def expired_holds(self, now=None):
+        """
+        purpose: Selects the lines whose cart hold has run out but not yet been released
+        args: now: (datetime): the time to compare against, by default now
+        returns: (QuerySet): the lines still holding units past their reserved_until
+        """
+        return self.filter(reserved__gt=0, reserved_until__lte=now or timezone.now())
+
+    def release(self):
+        """
+        purpose: Gives the units every line in the queryset holds back to stock, with one update of the products
+            and one of the lines per 500 lines
+        args: None
+        returns: (integer): the number of units released
+        """
+        released = 0
+        # no savepoint of its own when called from remove() or Order.cancel(); their transaction is enough
+        with transaction.atomic(savepoint=False):
+            held = list(self.filter(reserved__gt=0).select_for_update().order_by('pk').values_list(
+                'pk', 'product', 'reserved', 'shard'))
+            for start in range(0, len(held), 500):
+                batch = held[start:start + 500]
+                units_by_product, units_by_shard = {}, {}
+                for line_id, product_id, units, shard in batch:
+                    if shard is None:
+                        units_by_product[product_id] = units_by_product.get(product_id, 0) + units
+                    else:
+                        units_by_shard[product_id, shard] = units_by_shard.get((product_id, shard), 0) + units
+                if units_by_product:
+                    Product.objects.filter(pk__in=units_by_product).update(reserved=F('reserved') - Case(
+                        *[When(pk=product_id, then=Value(units)) for product_id, units in units_by_product.items()],
+                        output_field=models.IntegerField()))
+                for (product_id, shard), units in units_by_shard.items():
+                    StockShard.objects.filter(product_id=product_id, number=shard).update(
+                        reserved=F('reserved') - units)
+                ProductOrder.objects.filter(pk__in=[line[0] for line in batch]).update(
+                    reserved=0, reserved_until=None, shard=None)
+                released += sum(units_by_product.values()) + sum(units_by_shard.values())
+        return released
+
+    def remove(self):
+        """
+        purpose: Deletes the lines in the queryset, giving back to stock any units they hold
+        args: None
+        returns: (None): N/A
+        """
+        with transaction.atomic():
+            self.release()
+            self.delete()
+
 
 class ProductOrder(models.Model):
     """
@@ -110,6 +615,17 @@ class ProductOrder(models.Model):
     """   
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    # units of quantity held in stock for this cart line, and until when (see ProductOrderQuerySet.add_product)
+    reserved = models.PositiveIntegerField(default=0)
+    reserved_until = models.DateTimeField(null=True, blank=True)
+    # the StockShard number holding those units, when the product's stock is sharded
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
+    # the product's price and title when the order was checked out; empty while the line is in a cart
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    title = models.CharField(max_length=255, blank=True)
+
+    objects = ProductOrderQuerySet.as_manager()
 
     def __str__(self):
         return str(self.id)
@@ -117,12 +633,145 @@ class ProductOrder(models.Model):
 
     class Meta:
         ordering = ('product',)
+        unique_together = ('order', 'product')
+        indexes = [
+            # release_expired_holds finds the lines whose hold has run out
+            models.Index(fields=['reserved_until'], name='productorder_hold_expiry_idx'),
+        ]
 
     def __str__(self):
         return self.product.title
 
 
 
+class SellerDailySalesQuerySet(models.QuerySet):
+    """
+    purpose: Keeps the sales rollup up to date as orders are checked out
+    args: Extends the models.QuerySet Django class
+    returns: (None): N/A
+    """
+
+    def record(self, day, sales):
+        """
+        purpose: Adds sales to the day's rollup rows, creating the rows that don't exist yet
+        args: day: (date): the day the sales were made, sales: (list): (seller id, product id, units, revenue)
+            tuples; negative units and revenue take sales back out
+        returns: (None): N/A
+        """
+        for seller_id, product_id, units, revenue in sales:
+            row = self.filter(seller_id=seller_id, product_id=product_id, day=day)
+            if row.update(units=F('units') + units, revenue=F('revenue') + revenue):
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(seller_id=seller_id, product_id=product_id, day=day, units=units, revenue=revenue)
+            except IntegrityError:
+                # another checkout created the row first
+                row.update(units=F('units') + units, revenue=F('revenue') + revenue)
+
+
+class SellerDailySales(models.Model):
+    """
+    purpose: The units and revenue of one seller's product on one day, kept up to date at checkout so the
+        sales dashboard never has to add up the order history (see rebuild_sales_rollup)
+    args: Extends the models.Model Django class
+    returns: (None): N/A
+    """
+    seller = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    day = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = SellerDailySalesQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('seller', 'product', 'day')
+        indexes = [
+            # the dashboard reads a seller's most recent days
+            models.Index(fields=['seller', '-day'], name='sales_seller_day_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {} {}'.format(self.seller_id, self.product_id, self.day)
+
+
+def _rating_change(opinion, sign=1):
+    # the likes/dislikes counter change for adding (sign=1) or taking away (sign=-1) one opinion
+    if opinion > 0:
+        return {'likes': sign}
+    return {'dislikes': sign}
+
+
+class ProductOpinionQuerySet(models.QuerySet):
+    """
+    purpose: The one way opinions are recorded, so the unique (product, customer) row and the
+        product's like/dislike counters always change together
+    args: Extends the models.QuerySet Django class
+    returns: (None): N/A
+    """
+
+    def record(self, product_id, customer_id, opinion):
+        """
+        purpose: Sets a customer's opinion of a product to like (1) or dislike (-1), inserting it or replacing
+            the one they already have
+        args: product_id: (integer): the product, customer_id: (integer): the customer's user id,
+            opinion: (integer): 1 to like, -1 to dislike
+        returns: (integer): the customer's opinion, now the one given
+        """
+        with transaction.atomic():
+            # insert first: the unique constraint, not a preceding read, decides whether the customer
+            # already has an opinion, so concurrent clicks can't both insert
+            if self._create_if_missing(product_id, customer_id, opinion):
+                return opinion
+
+            # update only a row still holding the other opinion, so the counters move once per real change
+            current = self.filter(product=product_id, customer=customer_id).exclude(opinion=opinion).values_list(
+                'opinion', flat=True).first()
+            if current is not None and self.filter(
+                    product=product_id, customer=customer_id, opinion=current).update(opinion=opinion):
+                Product.objects.filter(pk=product_id).adjust_ratings(
+                    **dict(_rating_change(current, -1), **_rating_change(opinion)))
+        return opinion
+
+    def record_many(self, product_ids, customer_id, opinion):
+        """
+        purpose: Gives a customer's opinion of several products, leaving any opinion they already have alone
+        args: product_ids: (list): the products, customer_id: (integer): the customer's user id,
+            opinion: (integer): 1 to like, -1 to dislike
+        returns: (None): N/A
+        """
+        with transaction.atomic():
+            already_rated = set(self.filter(
+                customer=customer_id, product__in=product_ids).values_list('product', flat=True))
+            missing = [product_id for product_id in product_ids if product_id not in already_rated]
+
+            try:
+                with transaction.atomic():
+                    self.bulk_create([
+                        ProductOpinion(product_id=product_id, customer_id=customer_id, opinion=opinion)
+                        for product_id in missing
+                    ])
+            except IntegrityError:
+                # a concurrent request rated one of them first; fall back to inserting one at a time
+                missing = [
+                    product_id for product_id in missing
+                    if self._create_if_missing(product_id, customer_id, opinion, adjust_ratings=False)
+                ]
+
+            Product.objects.filter(pk__in=missing).adjust_ratings(**_rating_change(opinion))
+
+    def _create_if_missing(self, product_id, customer_id, opinion, adjust_ratings=True):
+        try:
+            with transaction.atomic():
+                self.create(product_id=product_id, customer_id=customer_id, opinion=opinion)
+        except IntegrityError:
+            return False
+        if adjust_ratings:
+            Product.objects.filter(pk=product_id).adjust_ratings(**_rating_change(opinion))
+        return True
+
+
 class ProductOpinion(models.Model):
     """
     purpose: Store product likes and dislikes
@@ -134,8 +783,64 @@ class ProductOpinion(models.Model):
     customer = models.ForeignKey(User, on_delete=models.CASCADE)
     opinion = models.IntegerField(default=0)
 
+    objects = ProductOpinionQuerySet.as_manager()
 
+    class Meta:
+        unique_together = ('product', 'customer')
 
 
+class ArchivedOrderLineQuerySet(models.QuerySet):
+    """
+    purpose: Line item lookups for the order history of archived orders
+    args: Extends the models.QuerySet Django class
+    returns: (None): N/A
+    """
+
+    def history(self, order):
+        """
+        purpose: Selects the lines of an archived order, as ProductOrderQuerySet.history does for a live one
+        args: order: (ArchivedOrder or integer): the order, or its id, to list
+        returns: (QuerySet): the order's ArchivedOrderLine rows, each with its line_total
+        """
+        return self.filter(order=order).annotate(
+            line_total=ExpressionWrapper(F('unit_price') * F('quantity'), output_field=models.DecimalField()))
+
+
+class ArchivedOrder(models.Model):
+    """
+    purpose: A completed order moved out of the order tables by archive_orders once it is old enough; it keeps
+        its id, so links to it keep working
+    args: Extends the models.Model Django class
+    returns: (None): N/A
+    """
+    id = models.IntegerField(primary_key=True)
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    order_date = models.DateTimeField('Order Date')
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+
+    def __str__(self):
+        return str(self.id)
+
+    class Meta:
+        indexes = [
+            # the profile page lists a customer's archived orders by date
+            models.Index(fields=['customer', 'order_date'], name='archivedorder_customer_idx'),
+        ]
+
+
+class ArchivedOrderLine(models.Model):
+    """
+    purpose: A product on an archived order, as it was checked out
+    args: Extends the models.Model Django class
+    returns: (None): N/A
+    """
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    title = models.CharField(max_length=255)
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2)
+    quantity = models.PositiveIntegerField()
 
+    objects = ArchivedOrderLineQuerySet.as_manager()
 
+    def __str__(self):
+        return self.title
@@ -0,0 +1,95 @@
+"""
+Keyset (seek method) pagination for the product listings and order history.
+
+Pages are ordered newest first on -id and addressed by the id they start
+after (?after=<id>) or end before (?before=<id>), so fetching any page is
+one indexed range query no matter how deep it is, and links stay valid
+while products are added or removed. Listings ordered on another field
+first, such as the order history's dates, still use ids as cursors: the
+cursor's row is looked up for its place in the ordering, one more indexed
+query.
+"""
+from django.db.models import Q
+
+
+class KeysetPage(object):
+    """
+    purpose: One page of a keyset paginated listing; iterate it like the queryset it came from
+    args: object_list: (list): the page's rows, newest first, has_next: (boolean): older rows exist,
+        has_previous: (boolean): newer rows exist
+    returns: (None): N/A
+    """
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].pk if self.has_next and self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].pk if self.has_previous and self.object_list else None
+
+
+def _cursor(request, name):
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def _seek(queryset, cursor, order_field, direction):
+    # the rows before ('lt') or after ('gt') the cursor's row in (order_field, id) order, or None when the
+    # cursor's row is gone
+    if order_field is None:
+        return queryset.filter(**{'pk__' + direction: cursor})
+    value = queryset.filter(pk=cursor).values_list(order_field, flat=True).first()
+    if value is None:
+        return None
+    return queryset.filter(Q(**{order_field + '__' + direction: value}) |
+                           Q(**{order_field: value, 'pk__' + direction: cursor}))
+
+
+def paginate_keyset(queryset, request, per_page=20, order_field=None):
+    """
+    purpose: Fetches the page of a queryset named by the ?after= or ?before= cursor in the request
+    args: queryset: (QuerySet): the rows to page through, request: the full HTTP request object,
+        per_page: (integer): rows per page, order_field: (string): a field to order on before the id, e.g.
+        'order_date'; its rows must all have a value
+    returns: (KeysetPage): the requested page, newest first; the first page when there is no valid cursor
+    """
+    newest = ['-pk'] if order_field is None else ['-' + order_field, '-pk']
+    oldest = [field.lstrip('-') for field in newest]
+    after = _cursor(request, 'after')
+    before = _cursor(request, 'before')
+
+    if before is not None:
+        newer = _seek(queryset, before, order_field, 'gt')
+        if newer is not None:
+            rows = list(newer.order_by(*oldest)[:per_page + 1])
+            has_previous = len(rows) > per_page
+            rows = rows[:per_page]
+            rows.reverse()
+            return KeysetPage(rows, has_next=True, has_previous=has_previous)
+
+    if after is not None:
+        older = _seek(queryset, after, order_field, 'lt')
+        if older is None:
+            after = None
+        else:
+            queryset = older
+
+    rows = list(queryset.order_by(*newest)[:per_page + 1])
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=after is not None)
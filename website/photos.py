@@ -0,0 +1,105 @@
+"""
+Background processing of product photos.
+
+Right after a product with a photo is saved, and off the request thread:
+
+1. the uploaded original is normalized: turned upright, stripped of its
+   metadata, shrunk to PRODUCT_PHOTO_MAX_DIMENSION and re-encoded as
+   PRODUCT_PHOTO_FORMAT, then stored under a name made from a hash of its
+   content, so the same photo uploaded twice is only stored once;
+2. renditions, the resized copies the templates show, are generated from it:
+   settings.PRODUCT_PHOTO_RENDITIONS maps each rendition name to a
+   sorl-thumbnail geometry and crop, and pages link to them directly.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import features, Image, ImageOps
+from sorl.thumbnail import get_thumbnail
+
+from website.models import Product, ProductPhotoRendition
+from website.tasks import enqueue
+
+
+def normalize_photo(product_id):
+    """
+    purpose: Replaces a product's uploaded photo with an upright, metadata-free, bounded-size re-encode
+        stored under a content-hashed name
+    args: product_id: (integer): id of the product
+    returns: (None): N/A
+    """
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None or not product.product_photo:
+        return
+
+    photo_format = getattr(settings, 'PRODUCT_PHOTO_FORMAT', 'WEBP')
+    if photo_format == 'WEBP' and not features.check('webp'):
+        photo_format = 'JPEG'
+    max_dimension = getattr(settings, 'PRODUCT_PHOTO_MAX_DIMENSION', 1600)
+
+    original = product.product_photo
+    original.open('rb')
+    try:
+        image = ImageOps.exif_transpose(Image.open(original)).convert('RGB')
+    finally:
+        original.close()
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    # only the pixels are written out: EXIF, GPS and other metadata are left behind
+    encoded = io.BytesIO()
+    if photo_format == 'JPEG':
+        image.save(encoded, 'JPEG', quality=85, optimize=True, progressive=True)
+    else:
+        image.save(encoded, photo_format, quality=85)
+    content = encoded.getvalue()
+
+    digest = hashlib.sha256(content).hexdigest()
+    name = 'products/{}/{}.{}'.format(digest[:2], digest, 'jpg' if photo_format == 'JPEG' else photo_format.lower())
+    storage = original.storage
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(content))
+
+    original_name = original.name
+    Product.objects.filter(pk=product_id).update(product_photo=name)
+    if original_name != name and not Product.objects.filter(product_photo=original_name).exists():
+        storage.delete(original_name)
+
+
+def process_photo(product_id):
+    """
+    purpose: Normalizes a newly uploaded product photo, then generates its renditions
+    args: product_id: (integer): id of the product
+    returns: (None): N/A
+    """
+    normalize_photo(product_id)
+    generate_renditions(product_id)
+
+
+def generate_renditions(product_id):
+    """
+    purpose: Resizes a product's photo to every configured rendition and records where each one is stored
+    args: product_id: (integer): id of the product
+    returns: (None): N/A
+    """
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None or not product.product_photo:
+        return
+
+    for name, (geometry, crop) in settings.PRODUCT_PHOTO_RENDITIONS.items():
+        thumbnail = get_thumbnail(product.product_photo, geometry, crop=crop, quality=85)
+        ProductPhotoRendition.objects.update_or_create(
+            product=product, name=name,
+            defaults={'image': thumbnail.name, 'width': thumbnail.width, 'height': thumbnail.height},
+        )
+
+
+def queue_photo_processing(product):
+    """
+    purpose: Queues normalization and rendition generation of a product's photo, if it has a photo
+    args: product: (Product): the saved product
+    returns: (None): N/A
+    """
+    if product.product_photo:
+        enqueue(process_photo, product.pk)
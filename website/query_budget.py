@@ -0,0 +1,132 @@
+"""
+Query and time budgets for the test suite.
+
+Performance regressions in this app usually show up as a view running more
+queries than it used to (an N+1 loop over a queryset) rather than as a
+failing assertion. query_budget() fails a block of code, or a whole test when
+used as a decorator, that runs more queries or takes longer than declared,
+and lists the SQL it ran. measure_route() and budget_report() let a test
+measure whole pages, as website.tests.QueryBudgetTest does for every URL in
+website/urls.py against datasets seeded at two scales by seed_dataset().
+"""
+import difflib
+import io
+import time
+from collections import namedtuple
+from contextlib import ContextDecorator
+
+from django.core.management import call_command
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from website.instrumentation import duplicate_queries, query_shape
+from website.models import Order, PaymentType, Product, ProductPhotoRendition
+
+
+Measurement = namedtuple('Measurement', ['status', 'queries', 'ms'])
+
+
+def budget_report(label, measurement, queries, ms=None, baseline=None):
+    """
+    purpose: Describes how a measured request or block went over its budget
+    args: label: (string): what was measured, measurement: (Measurement): what it did, queries: (integer): the
+        query budget, ms: (number): the time budget, if any, baseline: (Measurement): the same thing measured on
+        a smaller dataset, if any
+    returns: (string): the report, or an empty string when the measurement is within budget
+    """
+    problems = []
+    if len(measurement.queries) > queries:
+        problems.append('ran {} queries, budget is {}'.format(len(measurement.queries), queries))
+    if ms is not None and measurement.ms > ms:
+        problems.append('took {:.0f}ms, budget is {}ms'.format(measurement.ms, ms))
+    if not problems:
+        return ''
+
+    lines = ['{} {}'.format(label, ' and '.join(problems))]
+    repeated = duplicate_queries(measurement.queries)
+    if repeated:
+        lines.append('Repeated statements:')
+        lines.extend('  {} x {}'.format(count, sql) for count, sql in repeated)
+    # the statements that appeared once the dataset grew, with their values blanked out
+    diff = list(difflib.unified_diff(
+        [query_shape(query['sql']) for query in baseline.queries],
+        [query_shape(query['sql']) for query in measurement.queries],
+        'smaller dataset', 'this dataset', lineterm='', n=1,
+    )) if baseline is not None else []
+    if diff:
+        lines.append('SQL compared with the smaller dataset ({} queries):'.format(len(baseline.queries)))
+        lines.extend(diff)
+    else:
+        lines.append('SQL:')
+        lines.extend('  {}. {}'.format(i, query['sql']) for i, query in enumerate(measurement.queries, 1))
+    return '\n'.join(lines)
+
+
+class query_budget(ContextDecorator):
+    """
+    purpose: Fails the code it wraps if it runs more than a number of queries or takes longer than a time
+    args: queries: (integer): the most queries allowed, ms: (number): the most milliseconds allowed, if any,
+        label: (string): names the code in the failure message, using: (string): the database alias to watch
+    returns: (None): N/A; raises AssertionError listing the SQL that ran when the budget is exceeded
+    """
+
+    def __init__(self, queries, ms=None, label='Block', using='default'):
+        self.queries = queries
+        self.ms = ms
+        self.label = label
+        self.using = using
+
+    def __enter__(self):
+        self.captured = CaptureQueriesContext(connections[self.using])
+        self.captured.__enter__()
+        self.started = time.perf_counter()
+        return self.captured
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        self.captured.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        report = budget_report(self.label, Measurement(None, self.captured.captured_queries, elapsed),
+                               self.queries, self.ms)
+        if report:
+            raise AssertionError(report)
+        return False
+
+
+def measure_route(client, method, path, data=None):
+    """
+    purpose: Requests a page and records the queries it ran and how long it took
+    args: client: (Client): the test client, logged in or not, method: (string): 'get' or 'post',
+        path: (string): the URL, data: (dict): query string or form data
+    returns: (Measurement): the response status, the queries and the milliseconds taken
+    """
+    with CaptureQueriesContext(connections['default']) as captured:
+        started = time.perf_counter()
+        response = getattr(client, method)(path, data or {})
+        elapsed = (time.perf_counter() - started) * 1000
+    return Measurement(response.status_code, captured.captured_queries, elapsed)
+
+
+def seed_dataset(scale, seed=1, photo_fraction=0.1):
+    """
+    purpose: Fills the test database with a generated storefront (see the generate_data command)
+    args: scale: (number): the dataset size, as for generate_data --scale, seed: (integer): random seed,
+        photo_fraction: (number): share of products with a photo
+    returns: (dict): ids to build URLs with: the logged in shopper, one of their payment types and past orders,
+        a product and its product type, and the media path of a photo rendition
+    """
+    call_command('generate_data', seed=seed, scale=scale, photo_fraction=photo_fraction, stdout=io.StringIO())
+
+    shopper = Order.objects.filter(active=False).order_by('customer', 'pk').first().customer
+    product = Product.objects.order_by('pk').first()
+    rendition = ProductPhotoRendition.objects.order_by('pk').first()
+    return {
+        'user': shopper,
+        'username': shopper.username,
+        'payment_type': PaymentType.objects.filter(customer=shopper).order_by('pk').first().pk,
+        'past_order': Order.objects.filter(customer=shopper, active=False).order_by('pk').first().pk,
+        'product': product.pk,
+        'product_type': product.product_type_id,
+        'media': rendition.image.name if rendition else '',
+    }
@@ -0,0 +1,215 @@
+"""
+Product search for the nav bar search box.
+
+Products are kept in a full text index by the backend named in the
+PRODUCT_SEARCH_BACKEND setting. When the setting is missing, SQLite databases
+use an FTS5 virtual table and every other database falls back to a LIKE scan
+until a native backend (e.g. a Postgres tsvector column) is written for it.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, connections, router
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from website.models import Product
+
+
+class SearchBackend(object):
+    """
+    purpose: The interface every product search backend implements
+    args: None
+    returns: (None): N/A
+    """
+
+    def setup(self):
+        """
+        purpose: Creates whatever tables or indexes the backend needs, if they are missing
+        """
+        pass
+
+    def rebuild(self):
+        """
+        purpose: Re-indexes every product from the product table
+        """
+        pass
+
+    def needs_rebuild(self):
+        """
+        purpose: Tells whether the index is missing or can't be kept up to date by index() and remove() alone
+        returns: (boolean): True when rebuild() should be run
+        """
+        return False
+
+    def index(self, product):
+        """
+        purpose: Adds a product to the index, or refreshes it when it is already indexed
+        args: product: (Product): the saved product
+        """
+        pass
+
+    def remove(self, product_id):
+        """
+        purpose: Drops a product from the index
+        args: product_id: (integer): id of the deleted product
+        """
+        pass
+
+    def count(self, query):
+        """
+        purpose: Counts the products matching a search
+        args: query: (string): the text typed into the search box
+        returns: (integer): number of matching products
+        """
+        raise NotImplementedError
+
+    def search(self, query, offset, limit):
+        """
+        purpose: Finds one page of the products matching a search, best match first
+        args: query: (string): the text typed into the search box, offset: (integer): matches to skip,
+            limit: (integer): most matches to return
+        returns: (list): ids of the matching products
+        """
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    purpose: Searches title, description and city with a LIKE scan of the product table; keeps no index
+    args: Extends SearchBackend
+    returns: (None): N/A
+    """
+
+    def _matches(self, query):
+        return Product.objects.filter(
+            Q(title__icontains=query) | Q(description__icontains=query) | Q(city__icontains=query))
+
+    def count(self, query):
+        return self._matches(query).count()
+
+    def search(self, query, offset, limit):
+        return list(self._matches(query).order_by('title', 'pk').values_list('pk', flat=True)[offset:offset + limit])
+
+
+class SqliteFTSSearchBackend(SearchBackend):
+    """
+    purpose: Searches an SQLite FTS5 index of product title, description and city, ranked by bm25
+    args: Extends SearchBackend
+    returns: (None): N/A
+    """
+    table = 'website_product_fts'
+
+    # bm25 column weights: a hit in the title counts most, then the city, then the description
+    rank = 'bm25(website_product_fts, 10.0, 1.0, 5.0)'
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+                "title, description, city, tokenize='unicode61 remove_diacritics 2', prefix='2 3')".format(self.table))
+
+    def rebuild(self):
+        self.setup()
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {}".format(self.table))
+            cursor.execute(
+                "INSERT INTO {} (rowid, title, description, city) "
+                "SELECT id, title, COALESCE(description, ''), COALESCE(city, '') FROM website_product".format(self.table))
+
+    def needs_rebuild(self):
+        if self.table not in connection.introspection.table_names():
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM {})".format(self.table))
+            indexed = cursor.fetchone()[0]
+        # an empty index has to be filled, and one still holding products that a flush removed has to be emptied
+        return not indexed or not Product.objects.exists()
+
+    def index(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT OR REPLACE INTO {} (rowid, title, description, city) VALUES (%s, %s, %s, %s)".format(self.table),
+                [product.pk, product.title, product.description or '', product.city or ''])
+
+    def remove(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {} WHERE rowid = %s".format(self.table), [product_id])
+
+    def _match_expression(self, query):
+        # quote every word so FTS5 operators typed into the box are searched for literally,
+        # and prefix-match the last word so results show up while it is still being typed
+        words = re.findall(r'\w+', query)
+        if not words:
+            return None
+        return ' '.join('"{}"'.format(word) for word in words) + '*'
+
+    def count(self, query):
+        match = self._match_expression(query)
+        if match is None:
+            return 0
+        # the index is rebuilt on the primary and copied to the replicas with the rest of the catalog
+        with connections[router.db_for_read(Product)].cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM {0} WHERE {0} MATCH %s".format(self.table), [match])
+            return cursor.fetchone()[0]
+
+    def search(self, query, offset, limit):
+        match = self._match_expression(query)
+        if match is None:
+            return []
+        with connections[router.db_for_read(Product)].cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid FROM {0} WHERE {0} MATCH %s ORDER BY {1}, rowid DESC LIMIT %s OFFSET %s".format(
+                    self.table, self.rank),
+                [match, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SearchResults(object):
+    """
+    purpose: A lazily evaluated, sliceable list of the products matching a search, so it can be handed to a Paginator
+    args: query: (string): the text typed into the search box, backend: (SearchBackend): backend to search with
+    returns: (None): N/A
+    """
+
+    def __init__(self, query, backend):
+        self.query = query
+        self.backend = backend
+
+    def count(self):
+        return self.backend.count(self.query)
+
+    def __getitem__(self, page):
+        ids = self.backend.search(self.query, page.start or 0, page.stop - (page.start or 0))
+        products = Product.objects.in_bulk(ids)
+        return [products[product_id] for product_id in ids if product_id in products]
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    purpose: Returns the configured search backend, creating it on first use
+    args: None
+    returns: (SearchBackend): the backend named by PRODUCT_SEARCH_BACKEND, or the default for the database in use
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+        if backend_path is None:
+            if connection.vendor == 'sqlite':
+                backend_path = 'website.search.SqliteFTSSearchBackend'
+            else:
+                backend_path = 'website.search.LikeSearchBackend'
+        _backend = import_string(backend_path)()
+    return _backend
+
+
+def search_products(query):
+    """
+    purpose: Searches the products for the text typed into the search box
+    args: query: (string): the text typed into the search box
+    returns: (SearchResults): the matching products, best match first
+    """
+    return SearchResults(query, get_backend())
@@ -0,0 +1,94 @@
+"""
+Caching the signed-in user between requests.
+
+Django's AuthenticationMiddleware loads the user from the database on every
+request that touches request.user, and the profile pages then load their
+Customer row too. CachedAuthenticationMiddleware (in place of Django's in
+settings.MIDDLEWARE) keeps the user, with their Customer already attached as
+request.user.customer, in the USER_CACHE alias of settings.CACHES for
+USER_CACHE_TIMEOUT seconds. Each request still checks the session against
+the cached user's password hash, as Django does, so changing the password
+signs out other sessions. Saving or deleting the User or Customer, or
+logging out, drops the cached copy (see website.signals).
+
+Where the session itself lives is set by SESSION_ENGINE (see settings).
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from website.models import Customer
+
+
+def _cache():
+    return caches[getattr(settings, 'USER_CACHE', 'default')]
+
+
+def user_cache_key(user_id):
+    return 'session-user:{}'.format(user_id)
+
+
+def forget_cached_user(user_id):
+    """
+    purpose: Drops the cached copy of a user, so their next request loads them from the database again
+    args: user_id: (integer): the user's id
+    returns: (None): N/A
+    """
+    _cache().delete(user_cache_key(user_id))
+
+
+def get_cached_user(request):
+    """
+    purpose: Returns the user signed in to a request's session, from the cache when it can
+    args: request: (HttpRequest): a request whose session has been loaded
+    returns: (User or AnonymousUser): the signed-in user, with their Customer attached if they have one
+    """
+    try:
+        user_id = request.session[auth.SESSION_KEY]
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    cache = _cache()
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            try:
+                user.customer
+            except Customer.DoesNotExist:
+                pass
+            cache.set(key, user, getattr(settings, 'USER_CACHE_TIMEOUT', 5 * 60))
+        return user
+
+    # the same check auth.get_user() makes: a password change ends the user's other sessions
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(session_hash, user.get_session_auth_hash())):
+        request.session.flush()
+        return AnonymousUser()
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    purpose: Sets request.user like Django's AuthenticationMiddleware, but from the user cache
+    args: Extends Django's AuthenticationMiddleware
+    returns: (None): N/A
+    """
+
+    def process_request(self, request):
+        super(CachedAuthenticationMiddleware, self).process_request(request)
+        request.user = SimpleLazyObject(lambda: _request_user(request))
+
+
+def _request_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = get_cached_user(request)
+    return request._cached_user
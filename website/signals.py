@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from website.models import Customer, Product, ProductType
+from website import cache, search, sessions
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """
+    Purpose: Keeps the search index in step with a product that was just created or edited
+    Args: instance -- the saved product
+    Returns: N/A
+    """
+    search.get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """
+    Purpose: Drops a deleted product from the search index
+    Args: instance -- the deleted product
+    Returns: N/A
+    """
+    search.get_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductType)
+@receiver(post_delete, sender=ProductType)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Purpose: Stops the cached catalog pages from being served once a product or product type changes
+    Args: sender -- the model class that changed
+    Returns: N/A
+    """
+    cache.bump_catalog_version()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    """
+    Purpose: Stops a user's requests from seeing their cached account once it changes
+    Args: instance -- the saved or deleted user
+    Returns: N/A
+    """
+    sessions.forget_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def forget_cached_customer(sender, instance, **kwargs):
+    """
+    Purpose: Stops a user's requests from seeing their cached customer profile once it changes
+    Args: instance -- the saved or deleted customer
+    Returns: N/A
+    """
+    sessions.forget_cached_user(instance.user_id)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    """
+    Purpose: Drops the cached account of a user who logged out
+    Args: user -- the user who logged out, or None if nobody was logged in
+    Returns: N/A
+    """
+    if user is not None:
+        sessions.forget_cached_user(user.pk)
+
+
+def rebuild_search_index(sender, **kwargs):
+    """
+    Purpose: Builds the search index after migrate when it was just created or is empty, or after a flush
+    removed the products it holds; every other migrate leaves it alone (manage.py rebuild_search_index
+    re-indexes everything on demand)
+    Args: sender -- the app config that was migrated
+    Returns: N/A
+    """
+    # a plain migrate before the website migrations exist (as migrate_llamas.sh runs first) has no product table
+    if Product._meta.db_table not in connection.introspection.table_names():
+        return
+    backend = search.get_backend()
+    if backend.needs_rebuild():
+        backend.rebuild()
@@ -0,0 +1,49 @@
+"""
+A small in-process task queue for work that should not hold up a request.
+
+TASK_BACKEND picks how queued tasks run:
+    'thread' -- on a pool of TASK_WORKERS background threads, once the
+                request's transaction has committed (the default)
+    'sync'   -- immediately, on the calling thread (used by the tests)
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        # worker threads open their own database connections; don't leave them hanging open
+        connection.close()
+
+
+def _submit(func, args, kwargs):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'TASK_WORKERS', 2))
+    _executor.submit(_run, func, args, kwargs)
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    purpose: Queues a function to run in the background
+    args: func: (callable): the task; pass it ids rather than model instances, *args/**kwargs: passed to func
+    returns: (None): N/A
+    """
+    if getattr(settings, 'TASK_BACKEND', 'thread') == 'sync':
+        func(*args, **kwargs)
+        return
+
+    # wait for the commit so the task sees the rows the request just wrote
+    transaction.on_commit(lambda: _submit(func, args, kwargs))
@@ -0,0 +1,65 @@
+"""
+Upload handling for product photos.
+
+LimitedImageUploadHandler sits in front of Django's TemporaryFileUploadHandler
+(see FILE_UPLOAD_HANDLERS in settings), so every upload is streamed to a
+temporary file in chunks and never held in memory. While the chunks stream
+past it refuses, without reading any further, files that are larger than
+PRODUCT_PHOTO_MAX_UPLOAD_SIZE or that don't start like an image. The reason
+is left on request.upload_rejected for the view to report.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+
+# leading bytes of the image formats a photo may be uploaded in
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',  # JPEG
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'GIF87a',
+    b'GIF89a',
+)
+
+
+def looks_like_an_image(data):
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return True
+    return data.startswith(IMAGE_SIGNATURES)
+
+
+class LimitedImageUploadHandler(FileUploadHandler):
+    """
+    purpose: Refuses uploads that are too large or are not images while they are still streaming in
+    args: Extends Django's FileUploadHandler
+    returns: (None): N/A
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.max_size = getattr(settings, 'PRODUCT_PHOTO_MAX_UPLOAD_SIZE', 10 * 2 ** 20)
+        # the whole request body is too big for any photo it holds to fit: refuse its files without reading them
+        self.request_too_large = content_length > self.max_size + 2 ** 20
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super(LimitedImageUploadHandler, self).new_file(
+            field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.received = 0
+        if self.request_too_large or (content_length or 0) > self.max_size:
+            self.reject('is larger than the {} MB limit'.format(self.max_size // 2 ** 20))
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not looks_like_an_image(raw_data):
+            self.reject('is not a JPEG, PNG, GIF or WebP image')
+
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.reject('is larger than the {} MB limit'.format(self.max_size // 2 ** 20))
+
+        # hand the chunk on to the next handler, which writes it to disk
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def reject(self, reason):
+        self.request.upload_rejected = '{} {}'.format(self.file_name, reason)
+        raise SkipFile()
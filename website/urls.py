@@ -1,8 +1,9 @@
+import re
+
 from django.conf.urls import url
 from django.conf import settings
-from django.conf.urls.static import static
 
-from . import views
+from . import media, views
 
 app_name = "website"
 urlpatterns = [
@@ -14,11 +15,13 @@ urlpatterns = [
     url(r'^sell$', views.sell_product, name='sell'),
     url(r'^products$', views.list_products, name='list_products'),
     url(r'^single_product/(?P<product_id>[0-9]+)/$', views.single_product, name='single_product'),
+    url(r'^top_rated$', views.top_rated, name='top_rated'),
     url(r'^product_types$', views.list_product_types, name='product_types'),
     url(r'^product_type_products/(?P<type_id>[0-9]+)/$', views.get_product_types, name='get_product_types'),
     url(r'^add_payment_type$', views.add_payment_type, name='add_payment_type'),
     url(r'^user_payment_types$', views.user_payment_types, name='user_payment_types'),
     url(r'^user_products$', views.user_products, name='user_products'),
+    url(r'^sales$', views.seller_dashboard, name='seller_dashboard'),
     url(r'^delete_user_product$', views.delete_user_product, name='delete_user_product'),
     url(r'^delete_payment_type$', views.delete_payment_type, name='delete_payment_type'),
     url(r'^add_to_cart/(?P<product_id>[0-9]+)/$', views.add_product_to_order, name='add_product_to_order'),
@@ -30,8 +33,11 @@ urlpatterns = [
     url(r'^search/$', views.search, name='search'),
     url(r'^order_detail(?P<order_id>[0-9]+)/$', views.view_order_detail, name='order_detail'),
     url(r'^edit_settings$', views.update_profile, name='edit_settings'),
+    url(r'^cache_stats$', views.view_cache_stats, name='cache_stats'),
+    url(r'^request_stats$', views.view_request_stats, name='request_stats'),
 ]
 
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+urlpatterns += [
+    url(r'^{}(?P<path>.+)$'.format(re.escape(settings.MEDIA_URL.lstrip('/'))), media.serve_media, name='media'),
+]
 
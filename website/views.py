@@ -1,22 +1,32 @@
+import datetime
+
+from django.contrib import messages
 from django.contrib.auth import logout, login, authenticate
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, Http404, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.template import RequestContext
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.views.generic import TemplateView
-from django.core.exceptions import MultipleObjectsReturned
 from django.contrib.auth.models import User
-from datetime import datetime
 
 from website.forms import UserForm, ProductForm, PaymentTypeForm, OrderForm
 from website.models import Product
 from website.models import ProductType
 from website.models import PaymentType
 from website.models import ProductOpinion
-from website.models import Order, ProductOrder, Customer
+from website.models import Order, ProductOrder, Customer, OutOfStock, SellerDailySales
+from website.models import ArchivedOrder, ArchivedOrderLine
+from website.cache import cache_stats, cached_catalog
+from website.instrumentation import request_stats
+from website.pagination import paginate_keyset
+from website.photos import queue_photo_processing
+from website.search import search_products
 
-from django.db.models import Q
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
 
 # standard Django view: query, template name, and a render method to render the data from the query into the template
 
@@ -27,7 +37,7 @@ def index(request):
     Args: request -- the full HTTP request object
     Returns: rendered view of the index page, with a list of products
     """
-    all_products = Product.objects.all().order_by('-id')[:20]
+    all_products = cached_catalog('index', lambda: list(Product.objects.all().order_by('-id')[:20]))
     template_name = 'index.html'
     return render(request, template_name, {'products': all_products})
 
@@ -127,6 +137,10 @@ def sell_product(request):
     elif request.method == 'POST':
         form = ProductForm(request.POST, request.FILES)
         form_data = request.POST
+
+        # set by website.uploads.LimitedImageUploadHandler while the photo streamed in
+        if getattr(request, 'upload_rejected', None):
+            return HttpResponse('Photo rejected: {}'.format(request.upload_rejected), status=413)
         
         if form.is_valid():
 
@@ -142,6 +156,7 @@ def sell_product(request):
             product.city = form.cleaned_data['city']
 
             product.save()
+            queue_photo_processing(product)
 
             return render(request, 'success.html', {})
         else:
@@ -152,9 +167,9 @@ def list_products(request):
     Purpose: to render a view with a list of all products
     Author: Boilerplate code
     Args: request -- the full HTTP request object
-    Returns: a rendered view of a list of products
+    Returns: a rendered view of one page of products, newest first
     """
-    all_products = Product.objects.all()
+    all_products = paginate_keyset(Product.objects.prefetch_related('renditions'), request)
     template_name = 'list.html'
     return render(request, template_name, {'products': all_products})
 
@@ -169,23 +184,45 @@ def single_product(request, product_id):
     Returns: (render): a view of the request, template to use, and product obj
     """
     if request.method == 'POST':
-        opinion = request.POST['opinion']
-        current_customer = request.user.id
-        current_user = User.objects.get(pk=current_customer)
-        current_product = Product.objects.get(pk=product_id)
+        if not request.user.is_authenticated:
+            return HttpResponseRedirect('/login')
 
         try:
-            product_opinion = ProductOpinion.objects.get(product=current_product, customer=current_user)
-        except:
-            product_opinion = ProductOpinion.objects.create(product=current_product, customer=current_user, opinion=opinion)
+            opinion = int(request.POST['opinion'])
+        except (KeyError, ValueError):
+            opinion = None
+        if opinion not in (1, -1):
+            return HttpResponseBadRequest('opinion must be 1 or -1')
+        current_product = get_object_or_404(Product, pk=product_id)
+
+        ProductOpinion.objects.record(current_product.pk, request.user.id, opinion)
 
         back_to_product = '/single_product/' + product_id
         return HttpResponseRedirect(back_to_product)
 
     elif request.method == 'GET':
         template_name = 'single.html'
-        product = get_object_or_404(Product, pk=product_id)            
-        return render(request, template_name, {"product": product})
+        product = get_object_or_404(Product.objects.prefetch_related('renditions'), pk=product_id)
+        return render(request, template_name, {"product": product, "available": product.available})
+
+
+def product_types_with_newest_products():
+    """
+    Purpose: To load every product type with its product count and its three newest products
+    Author: Jordan Nelson
+    Args: None
+    Returns: a list of product types, newest first, each with num_products and products set
+    """
+    product_types = list(ProductType.objects.annotate(num_products=Count('product')).order_by('-pk'))
+
+    newest_products = {}
+    for product in Product.objects.newest_per_type(3):
+        newest_products.setdefault(product.product_type_id, []).append(product)
+
+    for pt in product_types:
+        pt.products = newest_products.get(pt.id, [])
+
+    return product_types
 
 
 def list_product_types(request):
@@ -198,14 +235,19 @@ def list_product_types(request):
     Returns: Combines a given template with a given context dictionary and 
     returns an HttpResponse object with that rendered text.
     """
-    product_types = ProductType.objects.all().order_by('-pk')
-
-    for pt in product_types:
-        pt.num_products = pt.product_set.filter(product_type=pt.id).count()
-        pt.products = pt.product_set.filter(product_type=pt.id).order_by('-pk')[:3]
+    product_types = cached_catalog('product_types', product_types_with_newest_products)
 
     return render(request, 'product_types.html', {'product_types': product_types})
 
+def top_rated(request):
+    """
+    Purpose: To list the most liked products, read straight from each product's like counter
+    Args: request -- the full HTTP request object
+    Returns: a rendered view of the 20 most liked products
+    """
+    top_products = Product.objects.filter(likes__gt=0).order_by('-likes', '-id')[:20]
+    return render(request, 'top_rated.html', {'products': top_products})
+
 def get_product_types(request, type_id):
     """
     Purpose: To allow a hyperlink to a specific URL (with the parameter type_id)
@@ -217,7 +259,7 @@ def get_product_types(request, type_id):
     returns an HttpResponse object with that rendered text.
     """
     product_types = ProductType.objects.all().filter(pk=type_id)
-    products_of_type = Product.objects.all().filter(product_type=type_id)
+    products_of_type = paginate_keyset(Product.objects.all().filter(product_type=type_id), request)
 
     context = { 'product_types' : product_types, 'products_of_type' : products_of_type }
     
@@ -232,15 +274,22 @@ def profile(request):
     Returns: renders the profile template in the browser
     """
 
-    try:
-        past_orders = Order.objects.all().filter(customer=request.user, active=0)
-    except: 
-        alert('There is no Order History for this customer.')
-    current_user = request.user
-    customer = Customer.objects.get(user_id=current_user.id)
+    # the order history, newest first, a page at a time; orders old enough to have been archived (see
+    # archive_orders) come after the rest, under ?archived=1
+    archived = request.GET.get('archived') == '1'
+    if archived:
+        history = ArchivedOrder.objects.filter(customer=request.user)
+    else:
+        history = Order.objects.filter(customer=request.user, active=0, order_date__isnull=False)
+    past_orders = paginate_keyset(history.only('id', 'order_date', 'total'), request, order_field='order_date')
+    has_archive = (not archived and not past_orders.has_next and
+                   ArchivedOrder.objects.filter(customer=request.user).exists())
+    # the customer comes with the cached user (see website.sessions)
+    customer = request.user.customer
 
     template_name = 'profile.html'
-    return render(request, template_name, {'past_orders': past_orders, 'customer': customer})
+    return render(request, template_name, {
+        'past_orders': past_orders, 'archived': archived, 'has_archive': has_archive, 'customer': customer})
 
 
 @login_required(login_url='/login')
@@ -312,11 +361,36 @@ def user_products(request):
     Returns: list of products sold by the current user
     """
 
-    user_products = Product.objects.all().filter(seller = request.user)
+    user_products = paginate_keyset(Product.objects.all().filter(seller = request.user), request)
     template_name = 'user_products.html'
     return render(request, template_name, {'user_products': user_products})
 
 
+@login_required(login_url='/login')
+def seller_dashboard(request):
+    """
+    Purpose: To show a seller their units sold and revenue per day and per product over recent days
+    Args: request -- the full HTTP request object; the days query string parameter picks how many days back to show
+    Returns: the sales dashboard, read only from the SellerDailySales rollup so it costs the same however many orders there are
+    """
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 366)
+    except ValueError:
+        days = 30
+    since = timezone.localdate() - datetime.timedelta(days=days - 1)
+    sales = SellerDailySales.objects.filter(seller=request.user, day__gte=since)
+
+    by_day = sales.values('day').annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('-day')
+    by_product = (sales.values('product', 'product__title').annotate(units=Sum('units'), revenue=Sum('revenue'))
+                  .order_by('-revenue', 'product'))
+    totals = sales.aggregate(units=Sum('units'), revenue=Sum('revenue'))
+
+    return render(request, 'seller_dashboard.html', {
+        'days': days, 'by_day': by_day, 'by_product': by_product,
+        'units': totals['units'] or 0, 'revenue': totals['revenue'] or 0,
+    })
+
+
 @login_required(login_url='/login')
 def delete_user_product(request):
     """
@@ -354,10 +428,11 @@ def add_product_to_order(request, product_id):
         customer = request.user
         new_order = Order.objects.create(customer=customer, order_date=None, payment_type=None, active=1)
 
-    if product_to_add.quantity <= 0:
-        pass
-    elif product_to_add.quantity > 0:
-        add_to_ProductOrder = ProductOrder.objects.create(product=product_to_add, order=new_order)
+    try:
+        ProductOrder.objects.add_product(new_order, product_to_add)
+    except OutOfStock:
+        # every remaining unit is held in someone's cart; the cart is shown without it
+        messages.warning(request, 'Sorry, {} is out of stock.'.format(product_to_add.title))
 
     return HttpResponseRedirect('/cart')
 
@@ -369,24 +444,17 @@ def view_cart(request):
     Args: request --the full HTTP request object
     Returns: A list of the products added to a shopping cart and their total
     """
-    total = 0
+    customer = request.user
 
     try:
-        customer = request.user
-        order_id = Order.objects.get(customer=customer, active=1).id
+        order = Order.objects.get(customer=customer, active=1)
     except ObjectDoesNotExist:
-        customer = request.user
-        order_id = Order.objects.create(customer=customer, order_date=None, payment_type=None, active=1)
-
-    try:
-        products_in_cart = ProductOrder.objects.all().filter(order=order_id)
-    except:
-        return render(request, 'cart.html', { 'total' : total, 'orderid' : order_id } )
+        order = Order.objects.create(customer=customer, order_date=None, payment_type=None, active=1)
 
-    for product in products_in_cart:
-        total += product.product.price
+    products_in_cart = ProductOrder.objects.line_items(order).prefetch_related('product__renditions')
+    total = products_in_cart.total()
 
-    return render(request, 'cart.html', { 'products_in_cart' : products_in_cart, 'total' : total, 'orderid' : order_id } )
+    return render(request, 'cart.html', { 'products_in_cart' : products_in_cart, 'total' : total, 'orderid' : order.id } )
 
 @login_required(login_url='/login')
 def complete_order_add_payment(request, order_id):
@@ -397,7 +465,8 @@ def complete_order_add_payment(request, order_id):
     returns: a checkout page where the user sees their order total and can select a payment type for their order
     """
     if request.method == 'POST':
-        total = request.POST['total']
+        order = get_object_or_404(Order, pk=order_id, customer=request.user, active=1)
+        total = ProductOrder.objects.line_items(order).total()
         adding_payment_types = PaymentType.objects.filter(customer = request.user)
 
         template_name = 'checkout.html'
@@ -414,29 +483,19 @@ def order_confirmation(request):
     """
     if request.method == 'POST':
 
-        current_customer = request.user.id
-        current_user = User.objects.get(pk=current_customer)
-
         payment_type_id = request.POST['payment_type_id']
         order_id = request.POST['order_id']
 
-        products_on_order = ProductOrder.objects.values_list('product', flat=True).filter(order=order_id)
-        for each_product in products_on_order:
-            prodid = Product.objects.get(pk=each_product)
-            prodid.quantity = prodid.quantity - 1
-            prodid.quantity_sold = prodid.quantity_sold + 1
-            prodid.save()
+        completed_order = get_object_or_404(Order, pk=order_id, customer=request.user, active=1)
+        payment_type = get_object_or_404(PaymentType, pk=payment_type_id, customer=request.user)
 
-            try: # any purchased product is automatically liked
-                product_opinion = ProductOpinion.objects.get(product=prodid, customer=current_user)
-            except:
-                product_opinion = ProductOpinion.objects.create(product=prodid, customer=current_user, opinion=1)
+        try:
+            completed_order.complete(payment_type)
+        except OutOfStock as out_of_stock:
+            sold_out = Product.objects.get(pk=out_of_stock.product_id)
+            return HttpResponse("Sorry, there are not enough of {} left to complete your order.".format(sold_out))
 
-        completed_order = Order.objects.get(pk=order_id)
-        completed_order.payment_type = PaymentType.objects.get(pk=payment_type_id)
-        completed_order.active = False
-        completed_order.order_date = datetime.now()
-        completed_order.save()        
+        products_on_order = ProductOrder.objects.line_items(completed_order)
 
         return render(request, 'order_confirmation.html' , {'products_on_order' : products_on_order})
         
@@ -454,13 +513,12 @@ def delete_product_from_cart(request):
         order_for_deletion = request.POST['order_id']
         the_id = request.POST['the_id']
 
-        try:
-            ProductOrder.objects.get(product=deleted_product, order=order_for_deletion, pk=the_id).delete()
-        except MultipleObjectsReturned:
-            multiple_products = ProductOrder.objects.all().filter(product=deleted_product, order=order_for_deletion).delete()
+        ProductOrder.objects.filter(
+            product=deleted_product, order=order_for_deletion, order__customer=request.user, pk=the_id).remove()
 
         return HttpResponseRedirect('/cart')
 
+@login_required(login_url='/login')
 def view_cancel_order(request):
     """
     Purpose: to cancel an order and remove it from the database
@@ -469,28 +527,33 @@ def view_cancel_order(request):
     Returns: an updated Order table, without the specific order that has been cancelled
     """
     deleted_order = request.POST.get('order_id')
-    Order.objects.get(id=deleted_order).delete()
+    get_object_or_404(Order, pk=deleted_order, customer=request.user).cancel()
 
     return render(request, 'final_order_view.html' , {})
 
 
 def search(request):
     """
-    Purpose: Search for a product by title using search bar in nav.
+    Purpose: Search for a product by title, description or city using search bar in nav.
     Author: Aaron Barfoot
     Args: request -- the full HTTP request object
-    Returns: List of products matching search parameters entered by user.
+    Returns: One page of the products matching search parameters entered by user, best match first.
     """
-    all_products = Product.objects.all().order_by("title")
     query = request.GET.get("q")
     if query:
-        products = all_products.filter(
-            Q(title__contains=query) | Q(city__contains=query)).distinct()
-        return render(request, 'query_results.html', {'search': products})
+        paginator = Paginator(search_products(query), 20)
+        try:
+            products = paginator.page(request.GET.get("page", 1))
+        except PageNotAnInteger:
+            products = paginator.page(1)
+        except EmptyPage:
+            products = paginator.page(paginator.num_pages)
+        return render(request, 'query_results.html', {'search': products, 'query': query})
     
     return render(request, 'query_results.html', {})
 
 
+@login_required(login_url='/login')
 def view_order_detail(request, order_id):
     """
     Purpose: to show the user's past orders
@@ -498,19 +561,29 @@ def view_order_detail(request, order_id):
     Args: request -- the full HTTP request object, order_id - the id of the order 
     Returns: a view of order's details (products on the order and total cost)
     """
-
-    total = 0
-
-    products_in_cart = ProductOrder.objects.all().filter(order=order_id)
-
-    for each_item in products_in_cart:
-        total += each_item.product.price
+    order = Order.objects.filter(pk=order_id, customer=request.user).first()
+
+    if order is None:
+        # old orders are moved to the archive (see archive_orders), keeping their ids
+        order = get_object_or_404(ArchivedOrder, pk=order_id, customer=request.user)
+        products_in_cart = ArchivedOrderLine.objects.history(order)
+        total = order.total
+    elif order.total is not None:
+        # a completed order, as it was checked out
+        products_in_cart = ProductOrder.objects.history(order)
+        total = order.total
+    else:
+        # still a cart: show it at today's prices
+        products_in_cart = list(ProductOrder.objects.line_items(order))
+        for line in products_in_cart:
+            line.unit_price, line.title = line.product.price, line.product.title
+        total = ProductOrder.objects.line_items(order).total()
 
     template_name = 'order_detail.html'
-    order = get_object_or_404(Order, pk=order_id)            
     return render(request, template_name, {"order": order, "total": total, "products_in_cart": products_in_cart})
 
 
+@login_required(login_url='/login')
 def update_profile(request):
     """
     Purpose: to update customer's profile settings
@@ -524,17 +597,33 @@ def update_profile(request):
         current_user.first_name = customer_data['first_name']
         current_user.last_name = customer_data['last_name']
         current_user.save()
-        customer = Customer.objects.get(user_id=current_user.id)
+        customer = current_user.customer
         customer.phone = customer_data['phone']
         customer.street_address = customer_data['street_address']
         customer.save()
         return HttpResponseRedirect('/profile')
 
     else:
-        current_user = request.user
-        customer = Customer.objects.get(user_id=current_user.id)
-        context = {'customer': customer}
+        context = {'customer': request.user.customer}
         template_name = 'edit_settings.html'
         return render(request, template_name, context)
 
 
+@staff_member_required
+def view_cache_stats(request):
+    """
+    Purpose: To let staff see how often the catalog pages are served from the cache
+    Args: request -- the full HTTP request object
+    Returns: JSON with the catalog cache's hit and miss counts and current catalog version
+    """
+    return JsonResponse(cache_stats())
+
+
+@staff_member_required
+def view_request_stats(request):
+    """
+    Purpose: To let staff see how many queries and how much time each page takes, as measured in this worker process
+    Args: request -- the full HTTP request object
+    Returns: JSON with the request measurements by URL name
+    """
+    return JsonResponse(request_stats())